@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# Compares unpacking and packing fixed-size packets through
+# their precompiled codecs against going through 'pak' generically.
+
+import timeit
+import uuid
+import smo
+from smo import codec
+
+NUMBER = 20000
+
+def _time(func):
+    return timeit.timeit(func, number=NUMBER) / NUMBER * 1e6
+
+def bench(packet_cls):
+    client_id = uuid.uuid4()
+
+    packet = packet_cls(client_id=client_id)
+    frame  = codec.pack_packet(packet)
+
+    body = memoryview(frame)[codec.HEADER_SIZE:]
+
+    def unpack_generic():
+        unpacked           = packet_cls.unpack(bytes(body))
+        unpacked.client_id = client_id
+
+        return unpacked
+
+    def pack_generic():
+        return smo.Packet.pack(packet)
+
+    results = [
+        _time(lambda: codec.unpack_packet(packet_cls, body, client_id=client_id)),
+        _time(unpack_generic),
+        _time(lambda: codec.pack_packet(packet)),
+        _time(pack_generic),
+    ]
+
+    print(f"{packet_cls.__qualname__:<24}" + "".join(f"{result:>12.2f}" for result in results))
+
+def main():
+    print(f"{'(us per packet)':<24}{'unpack':>12}{'generic':>12}{'pack':>12}{'generic':>12}")
+
+    for packet_cls in (
+        smo.PlayerInfoPacket,
+        smo.CappyInfoPacket,
+        smo.GameInfoPacket,
+        smo.TagInfoPacket,
+        smo.PlayerConnectPacket,
+        smo.CaptureInfoPacket,
+        smo.ChangeStagePacket,
+    ):
+        if codec.packet_codec(packet_cls) is None:
+            print(f"{packet_cls.__qualname__:<24}no codec")
+
+            continue
+
+        bench(packet_cls)
+
+if __name__ == "__main__":
+    main()
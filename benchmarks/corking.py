@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# Compares how many writes and drains a late-join burst of packets
+# takes without corking, with 'Connection.corked', and with 'auto_cork'.
+#
+# Each write to an asyncio transport with nothing already
+# buffered is a 'send' syscall, so writes stand in for syscalls.
+
+import asyncio
+import time
+import uuid
+import smo
+
+# The players already in the lobby, each sending the joiner three packets.
+PLAYERS = (4, 16, 64)
+BURSTS  = 200
+
+class CountingWriter:
+    def __init__(self, writer):
+        self.writer = writer
+
+        self.writes = 0
+        self.drains = 0
+
+    def write(self, data):
+        self.writes += 1
+
+        self.writer.write(data)
+
+    async def drain(self):
+        self.drains += 1
+
+        await self.writer.drain()
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+def burst_packets(players):
+    packets = []
+    for index in range(players):
+        client_id = uuid.uuid4()
+
+        packets.append(smo.GameInfoPacket(client_id=client_id, stage_name="CapWorldHomeStage"))
+        packets.append(smo.PlayerConnectPacket(client_id=client_id, name=f"Player {index}"))
+        packets.append(smo.CostumeInfoPacket(client_id=client_id, body_model="Mario", cap_model="Mario"))
+
+    return packets
+
+async def _discard(reader, writer):
+    while len(await reader.read(0x10000)) > 0:
+        pass
+
+async def write_burst(conn, packets):
+    for packet in packets:
+        await conn.write_packet_instance(packet)
+
+async def write_auto_corked(conn, packets):
+    # Auto corking batches writes issued within the same
+    # iteration of the event loop, so they must be concurrent.
+    await asyncio.gather(*(conn.write_packet_instance(packet) for packet in packets))
+
+async def write_corked(conn, packets):
+    async with conn.corked():
+        await write_burst(conn, packets)
+
+async def bench(mode, players):
+    srv = await asyncio.start_server(_discard, "127.0.0.1", 0)
+    host, port = srv.sockets[0].getsockname()[:2]
+
+    reader, writer = await asyncio.open_connection(host, port)
+
+    writer = CountingWriter(writer)
+    conn   = smo.Connection(reader=reader, writer=writer)
+
+    write = write_burst
+    if mode == "corked":
+        write = write_corked
+
+    elif mode == "auto_cork":
+        conn.auto_cork = True
+
+        write = write_auto_corked
+
+    packets = burst_packets(players)
+
+    start = time.perf_counter()
+
+    for _ in range(BURSTS):
+        await write(conn, packets)
+
+    elapsed = time.perf_counter() - start
+
+    conn.close()
+    await conn.wait_closed()
+
+    srv.close()
+    await srv.wait_closed()
+
+    return writer.writes / BURSTS, writer.drains / BURSTS, elapsed / BURSTS * 1e6
+
+async def main():
+    print(f"{'players':<10}{'mode':<12}{'writes':>10}{'drains':>10}{'us/burst':>12}")
+
+    for players in PLAYERS:
+        for mode in ("plain", "corked", "auto_cork"):
+            writes, drains, elapsed = await bench(mode, players)
+
+            print(f"{players:<10}{mode:<12}{writes:>10.1f}{drains:>10.1f}{elapsed:>12.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# Compares broadcasting a packet by packing it once for all recipients
+# against packing it again for each recipient, as lobbies grow.
+#
+# Recipients write into null writers so that only our own
+# overhead is measured, and not that of the network.
+
+import asyncio
+import time
+import uuid
+import numpy as np
+import smo
+
+BROADCASTS = 2000
+
+class NullWriter:
+    def __init__(self):
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+
+    async def drain(self):
+        pass
+
+    def is_closing(self):
+        return False
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+def create_lobby(players):
+    server = smo.Server()
+
+    clients = []
+    for index in range(players):
+        client = server.Connection(server, writer=NullWriter())
+        server._connect_client(client, uuid.uuid4(), f"Player {index}")
+
+        clients.append(client)
+
+    return server, clients
+
+async def broadcast_repacking(client, packet):
+    # What broadcasting did before packing once.
+    for other_client in client.server.connected_clients:
+        if other_client is client:
+            continue
+
+        await other_client.write_packet_instance(packet)
+
+async def bench(players, broadcast):
+    server, clients = create_lobby(players)
+
+    sender = clients[0]
+    packet = sender.create_packet(
+        smo.PlayerInfoPacket,
+
+        position = np.array([1.0, 2.0, 3.0]),
+        rotation = np.array([0.0, 0.0, 0.0, 1.0]),
+    )
+
+    start = time.perf_counter()
+
+    for _ in range(BROADCASTS):
+        await broadcast(sender, packet)
+
+    elapsed = time.perf_counter() - start
+
+    writes = sum(client.writer.writes for client in clients)
+    assert writes == BROADCASTS * (players - 1), writes
+
+    return writes / elapsed
+
+async def main():
+    print(f"{'players':<10}{'pack once':>14}{'repacking':>14}{'speedup':>10}   (packets delivered/s)")
+
+    for players in (2, 4, 8, 16, 32, 64):
+        pack_once = await bench(players, lambda client, packet: client.broadcast_packet_instance(packet))
+        repacking = await bench(players, broadcast_repacking)
+
+        print(f"{players:<10}{pack_once:>14.0f}{repacking:>14.0f}{pack_once / repacking:>9.1f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
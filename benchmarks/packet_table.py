@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+# Times looking up packet classes by ID, for IDs of known
+# packets and for unknown IDs which fall back to generic packets.
+
+import time
+import smo
+
+def bench(conn, packet_ids):
+    generation = smo.Packet._generation
+
+    start = time.perf_counter()
+
+    for packet_id in packet_ids:
+        conn.packet_cls_for_id(packet_id)
+
+    elapsed = time.perf_counter() - start
+
+    return elapsed, smo.Packet._generation - generation
+
+def main():
+    conn = smo.Connection()
+
+    known   = [packet_cls.id() for packet_cls in (smo.PlayerInfoPacket, smo.CappyInfoPacket, smo.GameInfoPacket)] * 100000
+    unknown = list(range(1000, 3000))
+
+    for name, packet_ids in (
+        ("known",           known),
+        ("unknown",         unknown),
+        ("unknown, cached", unknown),
+    ):
+        elapsed, resets = bench(conn, packet_ids)
+
+        print(f"{name:<16}{len(packet_ids):>8} lookups{elapsed * 1e9 / len(packet_ids):>10.0f} ns each{resets:>6} table resets")
+
+if __name__ == "__main__":
+    main()
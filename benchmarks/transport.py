@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Compares receiving frames and packets through 'asyncio' streams,
+# which are read in a loop, against receiving them through
+# 'transport.PacketProtocol', which hands them over as soon as
+# they're received.
+
+import asyncio
+import time
+import uuid
+import smo
+from smo import codec
+from smo import transport
+
+FRAMES = 200000
+RUNS   = 5
+
+async def _send_frames(reader, writer):
+    frame = codec.pack_packet(smo.PlayerInfoPacket(client_id=uuid.uuid4()))
+
+    # Write in chunks so frames straddle reads.
+    chunk = frame * 1000
+    for _ in range(FRAMES // 1000):
+        writer.write(chunk)
+        await writer.drain()
+
+    writer.close()
+
+async def receive_frames(conn):
+    frames = 0
+
+    def on_frame(client_id, packet_id, frame):
+        nonlocal frames
+
+        frames += 1
+
+    receive_frames = getattr(conn.reader, "receive_frames", None)
+
+    if receive_frames is None:
+        async for frame in conn.continuously_read_frames():
+            on_frame(*frame)
+
+    else:
+        await receive_frames(conn._recv, on_frame)
+
+    return frames
+
+async def receive_packets(conn):
+    packets = 0
+
+    def on_packet(packet):
+        nonlocal packets
+
+        packets += 1
+
+    await conn.receive_packets(on_packet)
+
+    return packets
+
+async def receive_lazy_packets(conn):
+    conn.lazy_packets = True
+
+    return await receive_packets(conn)
+
+async def bench(use_protocol, receive):
+    # Frames are always sent the same way so that only receiving them differs.
+    srv = await asyncio.start_server(_send_frames, "127.0.0.1", 0)
+
+    host, port = srv.sockets[0].getsockname()[:2]
+
+    if use_protocol:
+        reader, writer = await transport.open_connection(host, port)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    conn = smo.Connection(reader=reader, writer=writer)
+
+    start = time.perf_counter()
+
+    received = await receive(conn)
+
+    elapsed = time.perf_counter() - start
+
+    srv.close()
+    await srv.wait_closed()
+
+    assert received == FRAMES, received
+
+    return elapsed
+
+async def main():
+    print(f"{'(per second)':<14}{'frames':>12}{'packets':>12}{'lazy':>12}")
+
+    for use_protocol in (False, True):
+        results = []
+        for receive in (receive_frames, receive_packets, receive_lazy_packets):
+            # The best of a few runs, since other load on the machine adds noise.
+            results.append(min([await bench(use_protocol, receive) for _ in range(RUNS)]))
+
+        name = "protocol" if use_protocol else "streams"
+        print(f"{name:<14}" + "".join(f"{FRAMES / elapsed:>12.0f}" for elapsed in results))
+
+if __name__ == "__main__":
+    asyncio.run(main())
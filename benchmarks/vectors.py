@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+# Compares packing and unpacking 'Vector3f' and 'Quatf' against
+# the original implementation going through 'pak.Float32' per float.
+
+import timeit
+import numpy as np
+import pak
+from smo import types
+
+NUMBER = 100000
+
+class OldFloat32Array(pak.Type):
+    _num_floats = None
+
+    @classmethod
+    def _unpack(cls, buf, *, ctx):
+        return np.array([pak.Float32.unpack(buf, ctx=ctx) for x in range(cls._num_floats)])
+
+    @classmethod
+    def _pack(cls, value, *, ctx):
+        return b"".join(pak.Float32.pack(value[x], ctx=ctx) for x in range(cls._num_floats))
+
+class OldVector3f(OldFloat32Array):
+    _num_floats = 3
+
+class OldQuatf(OldFloat32Array):
+    _num_floats = 4
+
+def _time(func):
+    return timeit.timeit(func, number=NUMBER) / NUMBER * 1e6
+
+def bench(new_type, old_type):
+    value = np.arange(new_type._num_floats, dtype=np.float64)
+    data  = new_type.pack(value)
+
+    def unpack_zero_copy():
+        new_type.zero_copy = True
+
+        try:
+            return _time(lambda: new_type.unpack(data))
+
+        finally:
+            new_type.zero_copy = False
+
+    results = [
+        _time(lambda: old_type.unpack(data)),
+        _time(lambda: new_type.unpack(data)),
+        unpack_zero_copy(),
+        _time(lambda: old_type.pack(value)),
+        _time(lambda: new_type.pack(value)),
+    ]
+
+    print(f"{new_type.__qualname__:<16}" + "".join(f"{result:>12.2f}" for result in results))
+
+def main():
+    print(f"{'(us per value)':<16}{'old unpack':>12}{'unpack':>12}{'zero copy':>12}{'old pack':>12}{'pack':>12}")
+
+    bench(types.Vector3f, OldVector3f)
+    bench(types.Quatf,    OldQuatf)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+# Measures how the throughput of one lobby scales with the number
+# of worker processes serving it, see 'smo.run_workers'.
+#
+# Players are simulated over plain sockets from processes of their
+# own so that simulating them isn't what limits throughput. Each
+# sends movement as fast as the server reads it, and throughput is
+# how many movement packets reach other players each second.
+#
+# Scaling is bounded by the number of CPUs, which are shared with
+# the simulated players, so run this on a machine with a few of them.
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import struct
+import time
+import uuid
+import smo
+from smo import codec
+
+PORT       = 17127
+WORKERS    = (1, 2, 4)
+PLAYERS    = 32
+GENERATORS = 2
+WARMUP     = 2
+DURATION   = 5
+
+# Movement is written in batches to keep the simulated players cheap.
+BATCH = 16
+
+_header_struct = struct.Struct("<16xhh")
+
+async def _receive(reader, received):
+    buffer = bytearray()
+
+    while True:
+        data = await reader.read(0x10000)
+        if len(data) == 0:
+            return
+
+        buffer += data
+
+        offset = 0
+        while len(buffer) - offset >= codec.HEADER_SIZE:
+            packet_id, size = _header_struct.unpack_from(buffer, offset)
+
+            if len(buffer) - offset - codec.HEADER_SIZE < size:
+                break
+
+            if packet_id == smo.PlayerInfoPacket.id():
+                received[0] += 1
+
+            offset += codec.HEADER_SIZE + size
+
+        del buffer[:offset]
+
+async def _send(writer, client_id):
+    chunk = codec.pack_packet(smo.PlayerInfoPacket(client_id=client_id)) * BATCH
+
+    while True:
+        writer.write(chunk)
+        await writer.drain()
+
+        # Draining doesn't yield when the buffer isn't full.
+        await asyncio.sleep(0)
+
+async def _play(index, received):
+    client_id = uuid.uuid4()
+
+    reader, writer = await asyncio.open_connection("localhost", PORT)
+
+    writer.write(codec.pack_packet(smo.PlayerConnectPacket(
+        client_id = client_id,
+
+        type = smo.enums.ConnectionType.Init,
+        name = f"Player {index}",
+    )))
+
+    await asyncio.gather(_receive(reader, received), _send(writer, client_id))
+
+async def _generate(indices, results):
+    received = [0]
+
+    tasks = [asyncio.create_task(_play(index, received)) for index in indices]
+
+    await asyncio.sleep(WARMUP)
+    start = received[0]
+
+    await asyncio.sleep(DURATION)
+    results.put(received[0] - start)
+
+    for task in tasks:
+        task.cancel()
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def _run_generator(indices, results):
+    asyncio.run(_generate(indices, results))
+
+def _run_workers(workers):
+    smo.run_workers(workers, port=PORT, max_players=PLAYERS)
+
+def bench(workers):
+    server = multiprocessing.Process(target=_run_workers, args=(workers,))
+    server.start()
+
+    # Give the workers time to start and link.
+    time.sleep(1)
+
+    try:
+        results    = multiprocessing.Queue()
+        generators = [
+            multiprocessing.Process(target=_run_generator, args=(range(index, PLAYERS, GENERATORS), results))
+
+            for index in range(GENERATORS)
+        ]
+
+        for generator in generators:
+            generator.start()
+
+        delivered = sum(results.get() for _ in generators)
+
+        for generator in generators:
+            generator.join()
+
+        return delivered / DURATION
+
+    finally:
+        # Lets 'run_workers' terminate its workers.
+        os.kill(server.pid, signal.SIGINT)
+        server.join()
+
+def main():
+    print(f"{os.cpu_count()} CPUs, {PLAYERS} players")
+    print(f"{'workers':<10}{'delivered/s':>14}{'scaling':>10}")
+
+    baseline = None
+    for workers in WORKERS:
+        delivered = bench(workers)
+
+        if baseline is None:
+            baseline = delivered
+
+        print(f"{workers:<10}{delivered:>14.0f}{delivered / baseline:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+# Checks that players connected to different linked servers see each other.
+#
+# Usage: checks/peers.py workers|nodes|stages
+
+import asyncio
+import collections
+import multiprocessing
+import os
+import signal
+import sys
+import uuid
+import numpy as np
+import pak
+import smo
+
+PORT    = 17027
+PLAYERS = 16
+
+class RecordingClient(smo.Client):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, try_reconnecting=False, **kwargs)
+
+        # The client IDs of the players we've seen move.
+        self.seen = set()
+
+    @pak.packet_listener(smo.PlayerInfoPacket)
+    async def _record(self, packet):
+        self.seen.add(packet.client_id)
+
+async def check_players(*ports):
+    # Players are spread evenly over the ports.
+    clients = [
+        RecordingClient("localhost", ports[index % len(ports)], name=f"Player {index}", client_id=uuid.uuid4())
+
+        for index in range(PLAYERS)
+    ]
+
+    tasks = [asyncio.create_task(client.start()) for client in clients]
+
+    # Give the servers time to link and the players time to connect.
+    await asyncio.sleep(2)
+
+    for client in clients:
+        await client.write_packet(smo.PlayerInfoPacket, position=np.array([0.0, 0.0, 0.0]))
+
+    await asyncio.sleep(1)
+
+    failed = False
+    for client in clients:
+        missing = {other.client_id for other in clients if other is not client} - client.seen
+
+        if len(missing) > 0:
+            print(f"{client.name} didn't see {len(missing)} other players")
+
+            failed = True
+
+    for client in clients:
+        client.close()
+
+    for task in tasks:
+        task.cancel()
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return not failed
+
+def _run_workers():
+    smo.run_workers(2, port=PORT, max_players=PLAYERS)
+
+def check_workers():
+    process = multiprocessing.Process(target=_run_workers)
+    process.start()
+
+    try:
+        return asyncio.run(check_players(PORT))
+
+    finally:
+        # Lets 'run_workers' terminate its workers.
+        os.kill(process.pid, signal.SIGINT)
+        process.join()
+
+async def _check_nodes():
+    # Two nodes linked over TCP, the second connecting to the first.
+    nodes = [
+        smo.Server(port=PORT,     max_players=PLAYERS, peer_address="localhost", peer_port=PORT + 100),
+        smo.Server(port=PORT + 1, max_players=PLAYERS, peers=[("localhost", PORT + 100)]),
+    ]
+
+    for node in nodes:
+        await node.startup()
+
+    tasks = [asyncio.create_task(node.on_start()) for node in nodes]
+
+    try:
+        return await check_players(PORT, PORT + 1)
+
+    finally:
+        for node in nodes:
+            node.close()
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def check_nodes():
+    return asyncio.run(_check_nodes())
+
+class StageClient(smo.Client):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, try_reconnecting=False, **kwargs)
+
+        # Counts the movement packets we've received by type and client ID.
+        self.received = collections.Counter()
+
+    @pak.packet_listener(smo.PlayerInfoPacket, smo.CaptureInfoPacket)
+    async def _record(self, packet):
+        self.received[type(packet), packet.client_id] += 1
+
+async def _check_stages():
+    # Interest management and distance thinning apply to
+    # players on other nodes as they would on the same one.
+    nodes = [
+        smo.Server(port=PORT,     interest_management=True, distance_bands=smo.DistanceBands(), peer_address="localhost", peer_port=PORT + 100),
+        smo.Server(port=PORT + 1, interest_management=True, distance_bands=smo.DistanceBands(), peers=[("localhost", PORT + 100)]),
+    ]
+
+    for node in nodes:
+        await node.startup()
+
+    node_tasks = [asyncio.create_task(node.on_start()) for node in nodes]
+
+    mover     = StageClient("localhost", PORT,     name="Mover",     client_id=uuid.uuid4())
+    elsewhere = StageClient("localhost", PORT + 1, name="Elsewhere", client_id=uuid.uuid4())
+    joiner    = StageClient("localhost", PORT + 1, name="Joiner",    client_id=uuid.uuid4())
+
+    tasks = [asyncio.create_task(client.start()) for client in (mover, elsewhere)]
+
+    try:
+        await asyncio.sleep(1)
+
+        await mover.write_packet(smo.GameInfoPacket, stage_name="CapWorldHomeStage")
+        await elsewhere.write_packet(smo.GameInfoPacket, stage_name="WaterfallWorldHomeStage")
+
+        await asyncio.sleep(0.5)
+
+        await mover.write_packet(smo.PlayerInfoPacket, position=np.array([0.0, 0.0, 0.0]))
+        await mover.write_packet(smo.CaptureInfoPacket, name="Frog")
+
+        await asyncio.sleep(0.5)
+
+        # The joiner only learns of the mover's movement by catching up on entering the stage.
+        tasks.append(asyncio.create_task(joiner.start()))
+
+        await asyncio.sleep(0.5)
+
+        await joiner.write_packet(smo.GameInfoPacket, stage_name="CapWorldHomeStage")
+        await joiner.write_packet(smo.PlayerInfoPacket, position=np.array([100000.0, 0.0, 0.0]))
+
+        await asyncio.sleep(0.5)
+
+        # The joiner is far away, so only every 'far_interval'-th update reaches it.
+        for _ in range(8):
+            await mover.write_packet(smo.PlayerInfoPacket, position=np.array([0.0, 0.0, 0.0]))
+
+        await asyncio.sleep(0.5)
+
+        expected = {
+            (elsewhere, smo.PlayerInfoPacket):  0,
+            (elsewhere, smo.CaptureInfoPacket): 0,
+            (joiner,    smo.PlayerInfoPacket):  1 + 8 // smo.DistanceBands().far_interval,
+            (joiner,    smo.CaptureInfoPacket): 1,
+        }
+
+        failed = False
+        for (client, packet_cls), count in expected.items():
+            received = client.received[packet_cls, mover.client_id]
+
+            if received != count:
+                print(f"{client.name} received {received} of the mover's {packet_cls.__qualname__}s instead of {count}")
+
+                failed = True
+
+        return not failed
+
+    finally:
+        for client in (mover, elsewhere, joiner):
+            client.close()
+
+        for node in nodes:
+            node.close()
+
+        for task in (*tasks, *node_tasks):
+            task.cancel()
+
+        await asyncio.gather(*tasks, *node_tasks, return_exceptions=True)
+
+def check_stages():
+    return asyncio.run(_check_stages())
+
+def main():
+    checks = dict(
+        workers = check_workers,
+        nodes   = check_nodes,
+        stages  = check_stages,
+    )
+
+    ok = checks[sys.argv[1]]()
+
+    print("OK" if ok else "FAILED")
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
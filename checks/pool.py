@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+# Checks that a 'Proxy' hands players pooled upstream connections which
+# work, and notices when the upstream has closed idle pooled connections.
+#
+# Usage: checks/pool.py
+
+import asyncio
+import sys
+import uuid
+import smo
+
+PORT = 17227
+
+class IdleClosingServer(smo.Server):
+    # Lets us close connections nobody has connected through,
+    # like a server with a timeout for idle connections would.
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        # Maps the addresses of connections to their writers.
+        self.writers = {}
+
+    async def new_connection(self, reader, writer):
+        address = writer.get_extra_info("peername")
+
+        self.writers[address] = writer
+
+        try:
+            await super().new_connection(reader, writer)
+
+        finally:
+            del self.writers[address]
+
+    def close_connections_from(self, addresses):
+        for address in addresses:
+            self.writers[address].close()
+
+async def _wait_for(predicate, timeout=2):
+    loop     = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    while not predicate():
+        if loop.time() >= deadline:
+            return False
+
+        await asyncio.sleep(0.01)
+
+    return True
+
+async def _check_pool(port, *, use_protocol, balancing):
+    server = IdleClosingServer(port=port, use_protocol=use_protocol)
+
+    upstream = smo.Upstream("localhost", port)
+    proxy    = smo.Proxy(
+        upstreams    = [upstream],
+        balancing    = balancing,
+        host_port    = port + 1,
+        use_protocol = use_protocol,
+
+        upstream_pool_size = 2,
+
+        # Only refill the pool when connections are taken from it.
+        upstream_pool_interval = 60,
+    )
+
+    await server.startup()
+    await proxy.startup()
+
+    tasks   = [asyncio.create_task(server.on_start()), asyncio.create_task(proxy.on_start())]
+    clients = []
+
+    async def connect_player():
+        player_count = server.player_count
+
+        client = smo.Client("localhost", port + 1, name=f"Player {len(clients)}", client_id=uuid.uuid4(), try_reconnecting=False)
+
+        clients.append(client)
+        tasks.append(asyncio.create_task(client.start()))
+
+        return await _wait_for(lambda: server.player_count > player_count)
+
+    failed = False
+
+    def check(condition, message):
+        nonlocal failed
+
+        if not condition:
+            print(f"{message} ({use_protocol=}, {type(balancing).__qualname__})")
+
+            failed = True
+
+    try:
+        check(await _wait_for(lambda: upstream.pool_depth == 2), "The pool wasn't filled")
+
+        check(await connect_player(),  "The player given a pooled connection didn't connect")
+        check(upstream.pool_hits == 1, "The player wasn't given a pooled connection")
+
+        check(await _wait_for(lambda: upstream.pool_depth == 2), "The pool wasn't refilled")
+
+        server.close_connections_from(writer.get_extra_info("sockname") for reader, writer, init_frame in upstream._pool)
+
+        # Let us receive the upstream closing the connections.
+        await asyncio.sleep(0.2)
+
+        check(await connect_player(),  "The player connecting after idle connections were closed didn't connect")
+        check(upstream.pool_hits == 1, "A closed pooled connection was handed out")
+        check(upstream.failures == 0,  "Closing idle connections marked the upstream down")
+
+        return not failed
+
+    finally:
+        for client in clients:
+            client.close()
+
+        proxy.close()
+        server.close()
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _check_pools():
+    ok = True
+
+    port = PORT
+    for use_protocol in (False, True):
+        for balancing in (smo.LeastConnections(), smo.ConsistentHash()):
+            ok = await _check_pool(port, use_protocol=use_protocol, balancing=balancing) and ok
+
+            port += 2
+
+    return ok
+
+def main():
+    ok = asyncio.run(_check_pools())
+
+    print("OK" if ok else "FAILED")
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
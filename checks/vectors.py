@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# Checks that 'Vector3f' and 'Quatf' pack and unpack exactly
+# like the original per-float implementation did.
+
+import random
+import struct
+import uuid
+import numpy as np
+import pak
+import smo
+from smo import codec
+from smo import types
+
+SAMPLES = 10000
+
+class OldFloat32Array(pak.Type):
+    # The original implementation, going through 'pak.Float32' once per float.
+
+    _num_floats = None
+
+    @classmethod
+    def _unpack(cls, buf, *, ctx):
+        return np.array([pak.Float32.unpack(buf, ctx=ctx) for x in range(cls._num_floats)])
+
+    @classmethod
+    def _pack(cls, value, *, ctx):
+        return b"".join(pak.Float32.pack(value[x], ctx=ctx) for x in range(cls._num_floats))
+
+class OldVector3f(OldFloat32Array):
+    _num_floats = 3
+
+class OldQuatf(OldFloat32Array):
+    _num_floats = 4
+
+# Values which float32 can't represent exactly, or which are otherwise special.
+EDGE_VALUES = [
+    0.0, -0.0, 0.1, 1 / 3, 1e-45, 1e-40, 3.4e38, -3.4e38,
+    16777217.0, float("inf"), float("-inf"), float("nan"),
+]
+
+def random_value():
+    if random.random() < 0.2:
+        return random.choice(EDGE_VALUES)
+
+    return random.uniform(-1e5, 1e5)
+
+def check_pack(new_type, old_type):
+    for _ in range(SAMPLES):
+        value = np.array([random_value() for _ in range(new_type._num_floats)])
+
+        assert new_type.pack(value) == old_type.pack(value), value
+
+def check_unpack(new_type, old_type):
+    # Random bytes may be signaling NaNs, which numpy warns about converting.
+    with np.errstate(invalid="ignore"):
+        _check_unpack(new_type, old_type)
+
+def _check_unpack(new_type, old_type):
+    for _ in range(SAMPLES):
+        data = random.randbytes(new_type._size)
+
+        new_value = new_type.unpack(data)
+        old_value = old_type.unpack(data)
+
+        assert new_value.dtype == old_value.dtype, (new_value.dtype, old_value.dtype)
+        assert np.array_equal(new_value, old_value, equal_nan=True), (data, new_value, old_value)
+
+def check_rounding():
+    # Packing rounds to the nearest float32, and unpacking gives back that float32 exactly.
+    value = np.array([0.1, 1 / 3, 16777217.0])
+
+    rounded = types.Vector3f.unpack(types.Vector3f.pack(value))
+
+    assert rounded.tolist() == [struct.unpack("<f", struct.pack("<f", x))[0] for x in value], rounded
+    assert rounded.tolist() != value.tolist()
+
+def check_zero_copy():
+    types.Vector3f.zero_copy = True
+
+    try:
+        data  = struct.pack("<3f", 1.0, 2.0, 3.0)
+        value = types.Vector3f.unpack(data)
+
+        assert value.dtype == np.dtype("<f4"), value.dtype
+        assert value.tolist() == [1.0, 2.0, 3.0], value
+
+        assert not value.flags.writeable
+
+        try:
+            value[0] = 4.0
+
+        except ValueError:
+            pass
+
+        else:
+            raise AssertionError("zero copy arrays should be read-only")
+
+        # Zero copy values still pack to the same bytes.
+        assert types.Vector3f.pack(value) == data
+
+    finally:
+        types.Vector3f.zero_copy = False
+
+def check_codec():
+    # Precompiled codecs decode the same values as going through 'pak'.
+    packet = smo.PlayerInfoPacket(
+        client_id = uuid.uuid4(),
+
+        position = np.array([random_value() for _ in range(3)]),
+        rotation = np.array([random_value() for _ in range(4)]),
+    )
+
+    body = memoryview(codec.pack_packet(packet))[codec.HEADER_SIZE:]
+
+    decoded = codec.unpack_packet(smo.PlayerInfoPacket, body, client_id=packet.client_id)
+    generic = smo.PlayerInfoPacket.unpack(bytes(body))
+
+    assert np.array_equal(decoded.position, generic.position, equal_nan=True)
+    assert np.array_equal(decoded.rotation, generic.rotation, equal_nan=True)
+
+def main():
+    for new_type, old_type in ((types.Vector3f, OldVector3f), (types.Quatf, OldQuatf)):
+        check_pack(new_type, old_type)
+        check_unpack(new_type, old_type)
+
+    check_rounding()
+    check_zero_copy()
+
+    for _ in range(1000):
+        check_codec()
+
+    print("OK")
+
+if __name__ == "__main__":
+    main()
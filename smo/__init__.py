@@ -1,8 +1,17 @@
 from . import types
 from . import enums
+from . import codec
+from . import transport
 
 from .packets    import *
+from .outbound   import *
+from .dispatch   import *
+from .spatial    import *
 from .connection import *
+from .handler    import *
 from .client     import *
 from .server     import *
+from .workers    import *
+from .lobby      import *
+from .upstream   import *
 from .proxy      import *
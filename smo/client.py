@@ -3,17 +3,31 @@ import uuid
 import pak
 
 from . import enums
+from . import transport
 from .connection import Connection
+from .dispatch   import DispatchOrder
+from .handler    import PacketHandler
 from .packets import InitPacket, PlayerConnectPacket
 
 __all__ = [
     "Client",
 ]
 
-class Client(Connection, pak.AsyncPacketHandler):
-    def __init__(self, address, port=1027, *, name, client_id, try_reconnecting=True):
+class Client(Connection, PacketHandler):
+    def __init__(
+        self,
+        address,
+        port = 1027,
+        *,
+        name,
+        client_id,
+        try_reconnecting    = True,
+        use_protocol        = False,
+        dispatch_queue_size = None,
+        dispatch_order      = DispatchOrder.FIFO,
+    ):
         Connection.__init__(self)
-        pak.AsyncPacketHandler.__init__(self)
+        PacketHandler.__init__(self)
 
         self.address = address
         self.port    = port
@@ -22,8 +36,14 @@ class Client(Connection, pak.AsyncPacketHandler):
         self.client_id = client_id
 
         self.try_reconnecting = try_reconnecting
+        self.use_protocol     = use_protocol
         self._connection_type = enums.ConnectionType.Init
 
+        # If not 'None', received packets are dispatched to listeners
+        # from a bounded queue so that slow listeners don't hold up reading.
+        self.dispatch_queue_size = dispatch_queue_size
+        self.dispatch_order      = dispatch_order
+
     def register_packet_listener(self, coro_func, *packet_types, outgoing=False):
         return super().register_packet_listener(coro_func, *packet_types, outgoing=outgoing)
 
@@ -33,24 +53,76 @@ class Client(Connection, pak.AsyncPacketHandler):
         await self._listen_to_packet(packet, outgoing=True)
 
     async def _listen_to_packet(self, packet, *, outgoing):
-        async with self.listener_task_group(listen_sequentially=self._listen_sequentially) as group:
-            for listener in self.listeners_for_packet(packet, outgoing=outgoing):
-                group.create_task(listener(packet))
+        await self.call_listeners(
+            self.listeners_for_packet(packet, outgoing=outgoing),
+
+            packet,
+
+            listen_sequentially = self._listen_sequentially,
+        )
+
+    async def _dispatch_packet(self, packet):
+        # Packets from the dispatch queue are listened to sequentially
+        # so that the queue's ordering and bounds apply to the listeners.
+
+        await self.call_listeners(
+            self.listeners_for_packet(packet, outgoing=False),
+
+            packet,
+
+            listen_sequentially = True,
+        )
+
+    def _on_packet(self, packet):
+        # Returns what reading must wait for before the next packet, if anything.
+
+        # Packets are dispatched inline until we've been initialized.
+        if self._listen_sequentially:
+            return self._listen_to_packet(packet, outgoing=False)
+
+        if self.dispatch_queue is not None:
+            if self.dispatch_queue.is_full():
+                return self.dispatch_queue.put(packet)
+
+            self.dispatch_queue.put_nowait(packet)
+
+            return None
+
+        # Each listener runs in its own task, so there's nothing to wait for.
+        self.create_listener_tasks(self.listeners_for_packet(packet, outgoing=False), packet)
+
+        return None
 
     async def listen(self):
         try:
-            async for packet in self.continuously_read_packets():
-                await self._listen_to_packet(packet, outgoing=False)
+            await self.receive_packets(self._on_packet)
+
+            if self.dispatch_queue is not None:
+                await self.dispatch_queue.join()
 
         finally:
+            if self.dispatch_queue is not None:
+                self.dispatch_queue.close()
+
             await self.end_listener_tasks()
 
     async def open_streams(self):
+        if self.use_protocol:
+            return await transport.open_connection(self.address, self.port)
+
         return await asyncio.open_connection(self.address, self.port)
 
     async def startup(self):
         self.reader, self.writer = await self.open_streams()
 
+        if self.dispatch_queue_size is not None:
+            self.use_dispatch_queue(
+                self._dispatch_packet,
+
+                max_size = self.dispatch_queue_size,
+                order    = self.dispatch_order,
+            )
+
     async def on_start(self):
         self._listen_sequentially = True
 
@@ -68,7 +140,7 @@ class Client(Connection, pak.AsyncPacketHandler):
 
     def run(self):
         try:
-            asyncio.run(self.start())
+            transport.run(self.start(), use_uvloop=self.use_protocol)
 
         except KeyboardInterrupt:
             self.close()
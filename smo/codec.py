@@ -0,0 +1,424 @@
+import codecs
+import functools
+import inspect
+import struct
+import uuid
+import pak
+
+from .packets import Packet
+
+__all__ = [
+    "HEADER_SIZE",
+    "unpack_header",
+    "pack_header",
+    "frame_client_id",
+    "restamp_frame",
+    "PacketCodec",
+    "packet_codec",
+    "unpack_packet",
+    "lazy_packet",
+    "pack_packet",
+]
+
+_header_struct = struct.Struct("<16shh")
+
+HEADER_SIZE = _header_struct.size
+
+def unpack_header(buffer, offset=0):
+    client_id, packet_id, size = _header_struct.unpack_from(buffer, offset)
+
+    return uuid.UUID(bytes_le=client_id), packet_id, size
+
+def pack_header(client_id, packet_id, size):
+    return _header_struct.pack(client_id.bytes_le, packet_id, size)
+
+# The client ID is the first field of the header.
+_client_id_size = 0x10
+
+def frame_client_id(frame):
+    return uuid.UUID(bytes_le=bytes(frame[:_client_id_size]))
+
+def restamp_frame(frame, client_id, *, into=None):
+    # Returns 'frame' with the client ID in its header replaced.
+    #
+    # If 'into' is passed, the new frame is written into it and a
+    # view of it is returned, which is only valid until 'into' is reused.
+
+    if into is None:
+        restamped = bytearray(frame)
+        restamped[:_client_id_size] = client_id.bytes_le
+
+        return restamped
+
+    restamped = memoryview(into)[:len(frame)]
+
+    restamped[:_client_id_size] = client_id.bytes_le
+    restamped[_client_id_size:] = frame[_client_id_size:]
+
+    return restamped
+
+_primitive_formats = {
+    pak.Bool:    "?",
+    pak.Int8:    "b",
+    pak.UInt8:   "B",
+    pak.Int16:   "h",
+    pak.UInt16:  "H",
+    pak.Int32:   "i",
+    pak.UInt32:  "I",
+    pak.Int64:   "q",
+    pak.UInt64:  "Q",
+    pak.Float32: "f",
+    pak.Float64: "d",
+}
+
+def _overrides(cls, base, *attrs):
+    for parent in cls.__mro__:
+        if parent is base:
+            return False
+
+        if any(attr in vars(parent) for attr in attrs):
+            return True
+
+    return False
+
+def _primitive_format(field_type):
+    for primitive, fmt in _primitive_formats.items():
+        if not issubclass(field_type, primitive):
+            continue
+
+        # Subclasses like those made by 'pak.Defaulted' may
+        # change the default, but not how values are marshaled.
+        if _overrides(field_type, primitive, "_unpack", "_pack"):
+            return None
+
+        return fmt
+
+    return None
+
+def _static_size(field_type):
+    try:
+        size = field_type.size()
+
+    except Exception:
+        return None
+
+    if not isinstance(size, int):
+        return None
+
+    return size
+
+# Each field codec is a tuple of its struct format, how many
+# struct items it spans, and functions to convert the struct
+# items to and from the field's value, or 'None' if not needed.
+
+def _enum_codec(field_type):
+    fmt = _primitive_format(field_type.elem_type)
+    if fmt is None or _overrides(field_type, pak.Enum, "_unpack", "_pack"):
+        return None
+
+    enum_type = field_type.enum_type
+    invalid   = field_type.INVALID
+
+    def decode(value):
+        try:
+            return enum_type(value)
+
+        except ValueError:
+            return invalid
+
+    def encode(value):
+        if value is invalid:
+            raise ValueError(f"Cannot pack invalid value for {field_type.__qualname__}")
+
+        return value.value
+
+    return fmt, 1, decode, encode
+
+def _array_codec(field_type):
+    elem_type = field_type.elem_type
+    size      = field_type.array_size
+
+    if issubclass(elem_type, pak.Padding) and not _overrides(elem_type, pak.Padding, "_array_unpack", "_array_pack"):
+        return f"{size}x", 0, None, None
+
+    fmt = _primitive_format(elem_type)
+    if fmt is None:
+        return None
+
+    def encode(value):
+        return elem_type._array_ensure_size(value, size, ctx=None)
+
+    return f"{size}{fmt}", size, list, encode
+
+def _string_codec(field_type):
+    if _overrides(field_type, pak.StaticTerminatedString, "_unpack", "_pack"):
+        return None
+
+    # A NUL byte can only ever be a terminator in UTF-8,
+    # so the string data can simply be split on it.
+    if field_type.terminator != "\0" or codecs.lookup(field_type.encoding).name != "utf-8":
+        return None
+
+    size     = field_type.size()
+    encoding = field_type.encoding
+    errors   = field_type.errors
+
+    def decode(data):
+        string, terminator, _ = data.partition(b"\0")
+        if terminator == b"":
+            raise ValueError("Could not find terminator in string data")
+
+        return string.decode(encoding, errors)
+
+    def encode(value):
+        data = (value + "\0").encode(encoding, errors)
+
+        if len(data) > size:
+            raise ValueError(f"Value is too large to pack for '{field_type.__qualname__}': {repr(value)}")
+
+        # The struct pads the rest of the data with zeros.
+        return data
+
+    return f"{size}s", 1, decode, encode
+
+def _field_codec(field_type):
+    fmt = _primitive_format(field_type)
+    if fmt is not None:
+        return fmt, 1, None, None
+
+    if issubclass(field_type, pak.Enum):
+        return _enum_codec(field_type)
+
+    if issubclass(field_type, pak.Array.FixedSize):
+        return _array_codec(field_type)
+
+    if issubclass(field_type, pak.StaticTerminatedString):
+        return _string_codec(field_type)
+
+    if issubclass(field_type, pak.Padding) and not _overrides(field_type, pak.Padding, "_unpack", "_pack"):
+        return "x", 0, None, None
+
+    size = _static_size(field_type)
+    if size is None:
+        return None
+
+    # Our own types can convert raw bytes directly.
+    if hasattr(field_type, "_from_bytes"):
+        return (
+            f"{size}s", 1,
+
+            lambda data: field_type._from_bytes(data),
+            lambda value: field_type._to_bytes(value),
+        )
+
+    return (
+        f"{size}s", 1,
+
+        lambda data: field_type.unpack(data),
+        lambda value: field_type.pack(value),
+    )
+
+def _field_storage(packet_cls, name):
+    # Returns the key under which the field's descriptor stores its value
+    # in the packet's '__dict__', or 'None' if it stores nothing, and how
+    # the value is transformed when set. If the field must be set through
+    # its descriptor, then 'None' is returned instead.
+
+    descriptor = inspect.getattr_static(packet_cls, name, None)
+    if not isinstance(descriptor, pak.Type):
+        return None
+
+    descriptor_set = type(descriptor).__set__
+
+    if descriptor_set is pak.Type.__set__:
+        return descriptor.mangled_name, None
+
+    if descriptor_set is pak.Padding.__set__:
+        return None, None
+
+    if descriptor_set is pak.Array.__set__:
+        transform = descriptor.elem_type._array_transform_value
+        if transform.__func__ is pak.Type._array_transform_value.__func__:
+            transform = None
+
+        return descriptor.mangled_name, transform
+
+    return None
+
+def _then(decode, transform):
+    if decode is None:
+        return transform
+
+    return lambda value: transform(decode(value))
+
+class PacketCodec:
+    def __init__(self, packet_cls, packet_id, fields):
+        self.packet_cls = packet_cls
+        self.packet_id  = packet_id
+
+        body_fmt = "".join(fmt for name, fmt, count, decode, encode in fields)
+
+        self._body_struct  = struct.Struct("<" + body_fmt)
+        self._frame_struct = struct.Struct(_header_struct.format + body_fmt)
+
+        self.body_size = self._body_struct.size
+
+        self._encoders = tuple(
+            (name, count, encode)
+
+            for name, fmt, count, decode, encode in fields
+            if count > 0
+        )
+
+        # Values of fields which span no struct items, like padding.
+        self._template = {}
+
+        # Which struct items, either an index or a slice, each field is decoded from.
+        self._items = []
+
+        index = 0
+        for name, fmt, count, decode, encode in fields:
+            if count == 0:
+                self._template[name] = None
+
+            elif count == 1:
+                self._items.append((name, index, decode))
+
+            else:
+                self._items.append((name, slice(index, index + count), decode))
+
+            index += count
+
+        # Decoded values are stored directly in the packet's '__dict__'
+        # when possible, skipping going through each field's descriptor.
+        storage = {name: _field_storage(packet_cls, name) for name, *field_codec in fields}
+
+        self._direct = all(location is not None for location in storage.values())
+
+        if self._direct:
+            template = {}
+            for name, value in self._template.items():
+                key, transform = storage[name]
+
+                if key is not None:
+                    template[key] = value if transform is None else transform(value)
+
+            items = []
+            for name, item, decode in self._items:
+                key, transform = storage[name]
+
+                if transform is not None:
+                    decode = _then(decode, transform)
+
+                items.append((key, item, decode))
+
+            self._template = template
+            self._items    = items
+
+        self._items = tuple(self._items)
+
+    def unpack_from(self, buffer, offset=0, *, client_id, ctx=None):
+        values = self._body_struct.unpack_from(buffer, offset)
+
+        fields = self._template.copy()
+        for key, item, decode in self._items:
+            value = values[item]
+
+            if decode is not None:
+                value = decode(value)
+
+            fields[key] = value
+
+        # Like 'pak.Packet.unpack', the packet isn't initialized normally.
+        packet = object.__new__(self.packet_cls)
+
+        if self._direct:
+            fields["client_id"] = client_id
+
+            packet.__dict__.update(fields)
+
+            return packet
+
+        for name, value in fields.items():
+            setattr(packet, name, value)
+
+        packet.client_id = client_id
+
+        return packet
+
+    def pack(self, packet):
+        values = []
+        for name, count, encode in self._encoders:
+            value = getattr(packet, name)
+
+            if encode is not None:
+                value = encode(value)
+
+            if count == 1:
+                values.append(value)
+            else:
+                values.extend(value)
+
+        return self._frame_struct.pack(packet.client_id.bytes_le, self.packet_id, self.body_size, *values)
+
+@pak.util.cache
+def packet_codec(packet_cls):
+    if packet_cls.Header is not Packet.Header or _overrides(packet_cls, pak.Packet, "pack", "unpack"):
+        return None
+
+    packet_id = packet_cls.id()
+    if packet_id is None:
+        return None
+
+    fields = []
+    for name, field_type in packet_cls.enumerate_field_types():
+        field_codec = _field_codec(field_type)
+        if field_codec is None:
+            return None
+
+        fields.append((name, *field_codec))
+
+    return PacketCodec(packet_cls, packet_id, fields)
+
+def unpack_packet(packet_cls, data, *, client_id, ctx=None):
+    codec = packet_codec(packet_cls)
+    if codec is not None and len(data) == codec.body_size:
+        return codec.unpack_from(data, client_id=client_id, ctx=ctx)
+
+    packet           = packet_cls.unpack(bytes(data), ctx=ctx)
+    packet.client_id = client_id
+
+    return packet
+
+def _unpack_frame(packet_cls, frame, ctx):
+    return unpack_packet(packet_cls, memoryview(frame)[HEADER_SIZE:], client_id=frame_client_id(frame), ctx=ctx)
+
+def lazy_packet(packet_cls, frame, *, client_id, ctx=None):
+    # Creates a packet whose fields are only unpacked once they're accessed,
+    # see 'Packet.__getattr__'.
+    #
+    # Until then, packing it reuses 'frame', re-stamped if its 'client_id' changed.
+
+    packet = object.__new__(packet_cls)
+
+    packet.__dict__.update(
+        client_id    = client_id,
+        _lazy_frame  = frame,
+        _lazy_unpack = functools.partial(_unpack_frame, packet_cls, frame, ctx),
+    )
+
+    return packet
+
+def pack_packet(packet, *, ctx=None):
+    frame = packet.__dict__.get("_lazy_frame")
+    if frame is not None:
+        if frame_client_id(frame) != packet.client_id:
+            return bytes(restamp_frame(frame, packet.client_id))
+
+        return frame
+
+    codec = packet_codec(type(packet))
+    if codec is None:
+        return packet.pack(ctx=ctx)
+
+    return codec.pack(packet)
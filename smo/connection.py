@@ -3,43 +3,343 @@ __all__ = [
 ]
 
 import asyncio
+import contextlib
 import uuid
 import pak
 
-from .packets import Packet, GenericPacketWithID
+from . import codec
+from . import transport
+from .packets  import Packet, GenericPacketWithID
+from .outbound import OutboundQueue, QueuePolicy
+from .dispatch import DispatchQueue, DispatchOrder
+
+class _PacketTable:
+    # Maps packet IDs to packet classes with a single list index.
+    #
+    # Entries are filled in as IDs are seen, and the whole
+    # table is cleared whenever a new packet class is defined.
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+
+        self._classes    = None
+        self._generation = None
+
+    def __getitem__(self, packet_id):
+        if self._generation != Packet._generation:
+            self._classes    = [None] * 0x10000
+            self._generation = Packet._generation
+
+        # Packet IDs are 'Int16's, so this maps them onto '[0, 0x10000)'.
+        index = packet_id & 0xFFFF
+
+        packet_cls = self._classes[index]
+        if packet_cls is None:
+            packet_cls = Packet.subclass_with_id(packet_id, ctx=self.ctx)
+
+            if packet_cls is None:
+                packet_cls = GenericPacketWithID(packet_id)
+
+            self._classes[index] = packet_cls
+
+        return packet_cls
+
+@pak.util.cache
+def _packet_table(ctx):
+    return _PacketTable(ctx)
 
 class Connection(pak.io.Connection):
+    # Whether writes issued within the same iteration of
+    # the event loop should be batched into a single write.
+    auto_cork = False
+
+    # Whether packets should be read as lazy packets, see 'codec.lazy_packet'.
+    lazy_packets = False
+
+    # Large enough to hold any frame, since the size in the header is an 'Int16'.
+    _recv_buffer_size = 0x10000
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs, ctx=Packet.Context())
 
         self.client_id = uuid.UUID(int=0)
 
+        self.outbound       = None
+        self.dispatch_queue = None
+
+        # Shared between all connections with an equal context.
+        self._packet_table = _packet_table(self.ctx)
+
+        self._cork_depth   = 0
+        self._write_buffer = []
+        self._flush_task   = None
+
+        # Received data is read into this buffer, which is reused for every packet.
+        self._recv = transport.ReceiveBuffer(self._recv_buffer_size)
+
+    def close(self):
+        if self.outbound is not None:
+            self.outbound.close()
+
+        self._write_buffer.clear()
+
+        self._recv.clear()
+
+        super().close()
+
+    @contextlib.asynccontextmanager
+    async def corked(self):
+        # Writes within the context are buffered and written all at once when it exits.
+
+        self._cork_depth += 1
+
+        try:
+            yield
+
+        finally:
+            self._cork_depth -= 1
+
+            if self._cork_depth == 0:
+                await self.flush()
+
+    async def flush(self):
+        if len(self._write_buffer) == 0:
+            return
+
+        data = b"".join(self._write_buffer)
+        self._write_buffer.clear()
+
+        await super().write_data(data)
+
+    async def _flush_soon(self):
+        # Tasks start after all the callbacks already scheduled
+        # for this iteration of the event loop, so every write
+        # issued in this iteration has been buffered by now.
+
+        self._flush_task = None
+
+        if self._cork_depth == 0:
+            await self.flush()
+
+    async def write_data(self, data):
+        if self._cork_depth > 0:
+            self._write_buffer.append(data)
+
+            return
+
+        if self.auto_cork:
+            self._write_buffer.append(data)
+
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_soon())
+
+            await asyncio.shield(self._flush_task)
+
+            return
+
+        await super().write_data(data)
+
+    def use_outbound_queue(self, max_size=None, *, policy=QueuePolicy.DropOldest, conflate=False, autoflush=True):
+        self.outbound = OutboundQueue(self, max_size=max_size, policy=policy, conflate=conflate, autoflush=autoflush)
+        self.outbound.start()
+
+    @property
+    def outbound_queue_depth(self):
+        if self.outbound is None:
+            return 0
+
+        return len(self.outbound)
+
+    def use_dispatch_queue(self, dispatch, *, max_size=64, order=DispatchOrder.FIFO):
+        # The queue is drained and closed by whatever reads from us, see 'DispatchQueue'.
+        self.dispatch_queue = DispatchQueue(self, dispatch, max_size=max_size, order=order)
+
+    @property
+    def dispatch_queue_depth(self):
+        if self.dispatch_queue is None:
+            return 0
+
+        return len(self.dispatch_queue)
+
     def create_packet(self, packet_cls, *, client=None, **fields):
         if client is None:
             client = self
 
         return packet_cls(client_id=client.client_id, **fields, ctx=self.ctx)
 
+    def _next_buffered_frame(self):
+        return self._recv.next_frame()
+
+    async def _fill_recv_buffer(self):
+        # Readers like 'transport.PacketProtocol' receive straight into our buffer.
+        receive_into = getattr(self.reader, "receive_into", None)
+        if receive_into is not None:
+            return await receive_into(self._recv)
+
+        # Move any partial frame to the front of the buffer.
+        self._recv.compact()
+
+        view = self._recv.view[self._recv.end:]
+        data = await self.reader.read(len(view))
+        size = len(data)
+
+        if size == 0:
+            return False
+
+        view[:size] = data
+        self._recv.end += size
+
+        return True
+
+    async def _read_next_frame(self):
+        # Returns the client ID, packet ID, and a view of the
+        # whole frame, which is only valid until the next read.
+
+        while True:
+            frame = self._next_buffered_frame()
+            if frame is not None:
+                return frame
+
+            if not await self._fill_recv_buffer():
+                return None
+
+    async def continuously_read_frames(self):
+        while not self.is_closing():
+            frame = await self._read_next_frame()
+            if frame is None:
+                self.close()
+                await self.wait_closed()
+
+                return
+
+            yield frame
+
+    def _reads_packets_generically(self):
+        cls = type(self)
+
+        return (
+            cls._read_next_packet is Connection._read_next_packet and
+
+            cls.continuously_read_packets is pak.io.Connection.continuously_read_packets
+        )
+
+    async def receive_packets(self, handler):
+        # Calls 'handler' with each packet read until we're closed or EOF
+        # is reached, awaiting what it returns before reading more, if it
+        # returns anything. Watches for packets are resolved beforehand,
+        # like 'continuously_read_packets' would.
+        #
+        # Readers like 'transport.PacketProtocol' call 'handler' as soon
+        # as data is received, without a reading loop in between, unless
+        # subclasses customize reading packets.
+
+        receive_frames = getattr(self.reader, "receive_frames", None)
+
+        if receive_frames is None or not self._reads_packets_generically():
+            async for packet in self.continuously_read_packets():
+                result = handler(packet)
+                if result is not None:
+                    await result
+
+            return
+
+        def on_frame(client_id, packet_id, frame):
+            packet = self.unpack_frame(client_id, packet_id, frame)
+
+            self._dispatch_to_packet_watches(packet)
+
+            return handler(packet)
+
+        if not self.is_closing():
+            await receive_frames(self._recv, on_frame)
+
+        # Like 'continuously_read_packets' at EOF.
+        self.close()
+        await self.wait_closed()
+
+    def packet_cls_for_id(self, packet_id):
+        return self._packet_table[packet_id]
+
+    def unpack_frame(self, client_id, packet_id, frame):
+        if self.lazy_packets:
+            return codec.lazy_packet(self.packet_cls_for_id(packet_id), bytes(frame), client_id=client_id, ctx=self.ctx)
+
+        return codec.unpack_packet(
+            self.packet_cls_for_id(packet_id),
+            frame[codec.HEADER_SIZE:],
+
+            client_id = client_id,
+            ctx       = self.ctx,
+        )
+
     async def _read_next_packet(self):
-        header_data = await self.read_data(Packet.Header.size(ctx=self.ctx))
-        if header_data is None:
+        frame = await self._read_next_frame()
+        if frame is None:
             return None
 
-        header = Packet.Header.unpack(header_data)
+        return self.unpack_frame(*frame)
 
-        packet_data = await self.read_data(header.size)
-        if packet_data is None:
-            return None
+    def pack_packet(self, packet):
+        return codec.pack_packet(packet, ctx=self.ctx)
 
-        packet_cls = Packet.subclass_with_id(header.id, ctx=self.ctx)
+    def _writes_packets_generically(self):
+        return type(self).write_packet_instance is Connection.write_packet_instance
 
-        if packet_cls is None:
-            packet_cls = GenericPacketWithID(header.id)
+    async def write_packet_instance(self, packet):
+        await self.write_data(self.pack_packet(packet))
 
-        packet           = packet_cls.unpack(packet_data, ctx=self.ctx)
-        packet.client_id = header.client_id
+    async def write_packed_packet(self, packet, data):
+        # 'data' must be what 'pack_packet' would return for 'packet'.
+        #
+        # Subclasses which customize 'write_packet_instance'
+        # still have every packet go through it.
+        if not self._writes_packets_generically():
+            await self.write_packet_instance(packet)
 
-        return packet
+            return
 
-    async def write_packet_instance(self, packet):
-        await self.write_data(packet.pack(ctx=self.ctx))
+        await self.write_data(data)
+
+    async def write_packed_packets(self, entries):
+        # 'entries' is an iterable of sequences starting with a packet and its data.
+        if not self._writes_packets_generically():
+            for packet, data, *_ in entries:
+                await self.write_packet_instance(packet)
+
+            return
+
+        await self.write_data(b"".join(data for packet, data, *_ in entries))
+
+    async def send_packet_instance(self, packet):
+        await self.send_packed_packet(packet, self.pack_packet(packet))
+
+    async def send_packed_packet(self, packet, data):
+        # Queue the packet if we have an outbound queue,
+        # otherwise write it out immediately.
+        if self.outbound is not None:
+            self.outbound.put(packet, data)
+
+            return
+
+        await self.write_packed_packet(packet, data)
+
+    async def send_frame(self, packet_cls, client_id, frame):
+        # Sends an already-serialized frame without a packet to go with it,
+        # re-stamping its header if it doesn't already have 'client_id'.
+
+        if codec.frame_client_id(frame) != client_id:
+            frame = codec.restamp_frame(frame, client_id)
+
+        if not self._writes_packets_generically():
+            packet = codec.unpack_packet(packet_cls, frame[codec.HEADER_SIZE:], client_id=client_id, ctx=self.ctx)
+
+            await self.send_packed_packet(packet, None)
+
+            return
+
+        if self.outbound is not None:
+            self.outbound.put(None, frame, packet_cls=packet_cls, client_id=client_id)
+
+            return
+
+        await self.write_data(frame)
@@ -0,0 +1,179 @@
+import asyncio
+import collections
+import enum
+
+__all__ = [
+    "DispatchOrder",
+    "DispatchQueue",
+]
+
+class DispatchOrder(enum.Enum):
+    # Packets are dispatched one at a time in the order they were read.
+    FIFO = enum.auto()
+
+    # Packets of the same type are dispatched in the order they
+    # were read, but packets of different types may overlap.
+    PerPacketType = enum.auto()
+
+    # Every packet is dispatched as soon as it's read.
+    Unordered = enum.auto()
+
+class DispatchQueue:
+    # Decouples reading packets from dispatching them to listeners.
+    #
+    # Read packets are handed off to lanes, each dispatched in order
+    # by their own task. When 'max_size' packets are pending, 'put'
+    # waits, so that we stop reading from the connection and the peer
+    # is held back by TCP flow control instead of by our listeners.
+
+    def __init__(self, connection, dispatch, *, max_size=64, order=DispatchOrder.FIFO):
+        self.connection = connection
+
+        # Called with each packet to dispatch it.
+        self.dispatch = dispatch
+
+        self.max_size = max_size
+        self.order    = order
+
+        self.dispatched = 0
+        self.max_depth  = 0
+
+        # How many times reading has had to wait for the queue to drain.
+        self.stalls = 0
+
+        self._depth = 0
+
+        # Maps lane keys to their pending packets.
+        self._lanes = {}
+        self._tasks = set()
+
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        self._exception = None
+        self._closed    = False
+
+    def __len__(self):
+        return self._depth
+
+    def _lane_key(self, packet):
+        if self.order is DispatchOrder.FIFO:
+            return None
+
+        if self.order is DispatchOrder.PerPacketType:
+            return type(packet)
+
+        # Each packet gets a lane of its own.
+        return object()
+
+    def _raise_if_failed(self):
+        if self._exception is not None:
+            raise self._exception
+
+    def is_full(self):
+        return self._depth >= self.max_size and not self._closed
+
+    async def put(self, packet):
+        self._raise_if_failed()
+
+        if self.is_full():
+            self.stalls += 1
+
+            while self.is_full():
+                self._not_full.clear()
+
+                await self._not_full.wait()
+
+        self.put_nowait(packet)
+
+    def put_nowait(self, packet):
+        # Like 'put', but doesn't wait for room when we're full.
+
+        self._raise_if_failed()
+
+        if self._closed:
+            return
+
+        self._depth += 1
+        if self._depth > self.max_depth:
+            self.max_depth = self._depth
+
+        self._idle.clear()
+
+        key  = self._lane_key(packet)
+        lane = self._lanes.get(key)
+
+        if lane is not None:
+            lane.append(packet)
+
+            return
+
+        lane = collections.deque((packet,))
+        self._lanes[key] = lane
+
+        task = asyncio.create_task(self._run_lane(key, lane))
+        task.add_done_callback(self._tasks.discard)
+
+        self._tasks.add(task)
+
+    async def _run_lane(self, key, lane):
+        try:
+            while len(lane) > 0:
+                # The packet is left in the lane while it's being
+                # dispatched so that new packets are appended to it.
+                try:
+                    await self.dispatch(lane[0])
+
+                except Exception as e:
+                    self._fail(e)
+
+                    return
+
+                lane.popleft()
+
+                self.dispatched += 1
+                self._depth     -= 1
+
+                self._not_full.set()
+
+        finally:
+            if self._lanes.get(key) is lane:
+                del self._lanes[key]
+
+            if self._depth == 0:
+                self._idle.set()
+
+    def _fail(self, exception):
+        # Reading stops and the exception is raised from 'put' or 'join',
+        # like it would have been had the packet been dispatched inline.
+
+        self._exception = exception
+
+        self.close()
+        self.connection.close()
+
+    async def join(self):
+        # Waits for every pending packet to be dispatched.
+
+        await self._idle.wait()
+
+        self._raise_if_failed()
+
+    def close(self):
+        self._closed = True
+
+        current_task = asyncio.current_task()
+        for task in self._tasks:
+            if task is not current_task:
+                task.cancel()
+
+        self._tasks.clear()
+        self._lanes.clear()
+
+        self._depth = 0
+
+        self._not_full.set()
+        self._idle.set()
@@ -0,0 +1,78 @@
+import asyncio
+import pak
+
+__all__ = [
+    "PacketHandler",
+]
+
+class PacketHandler(pak.AsyncPacketHandler):
+    # Listeners are matched by the type of the packet alone, so
+    # the listeners for each packet type and set of flags are
+    # cached until listeners are registered or unregistered.
+
+    def __init__(self):
+        # Set before calling the super constructor since it registers listeners.
+        self._listener_cache = {}
+
+        super().__init__()
+
+    def register_packet_listener(self, *args, **kwargs):
+        self._listener_cache.clear()
+
+        return super().register_packet_listener(*args, **kwargs)
+
+    def unregister_packet_listener(self, *args, **kwargs):
+        self._listener_cache.clear()
+
+        return super().unregister_packet_listener(*args, **kwargs)
+
+    def listeners_for_packet_type(self, packet_cls, **flags):
+        key = (packet_cls, *flags.items())
+
+        listeners = self._listener_cache.get(key)
+        if listeners is None:
+            # A bare instance is enough to match listeners against.
+            listeners = list(super().listeners_for_packet(object.__new__(packet_cls), **flags))
+
+            self._listener_cache[key] = listeners
+
+        return listeners
+
+    def listeners_for_packet(self, packet, **flags):
+        return self.listeners_for_packet_type(type(packet), **flags)
+
+    def create_listener_task(self, coroutine):
+        # Creates a listener task which reading doesn't wait for,
+        # like a task from 'listener_task_group(listen_sequentially=False)'
+        # but without wrapping the coroutine in another one. Outstanding
+        # tasks are still ended by 'end_listener_tasks'.
+
+        task = asyncio.create_task(coroutine)
+
+        self._listener_tasks.append(task)
+        task.add_done_callback(self._listener_tasks.remove)
+
+        return task
+
+    def create_listener_tasks(self, listeners, *args):
+        for listener in listeners:
+            self.create_listener_task(listener(*args))
+
+    async def call_listeners(self, listeners, *args, listen_sequentially):
+        # When listening sequentially, the listeners run concurrently and
+        # are all awaited before returning, so a lone listener is simply
+        # awaited inline. Otherwise each listener runs in its own task.
+
+        if not listen_sequentially:
+            self.create_listener_tasks(listeners, *args)
+
+            return
+
+        if len(listeners) == 1:
+            await listeners[0](*args)
+
+            return
+
+        async with self.listener_task_group(listen_sequentially=True) as group:
+            for listener in listeners:
+                group.create_task(listener(*args))
@@ -0,0 +1,187 @@
+import asyncio
+import collections
+import inspect
+
+from . import transport
+
+__all__ = [
+    "LobbyManager",
+]
+
+class LobbyManager:
+    # Hosts many independent lobbies, each a 'Server', in one event loop.
+    #
+    # Lobbies with a port listen on it themselves. If the manager has a
+    # port of its own, connections to it are handed to the lobby named
+    # by 'router', which is called with the manager and the connection's
+    # reader and writer, and may be a coroutine function. Lobbies only
+    # reached through the router should have a port of 'None'.
+    #
+    # Packet codecs and packet ID tables are cached per packet
+    # class and context, so they're already shared between lobbies.
+
+    def __init__(self, *, address=None, port=None, router=None, use_protocol=False):
+        self.address = address
+        self.port    = port
+        self.router  = router
+
+        self.use_protocol = use_protocol
+
+        # Maps names to lobbies.
+        self.lobbies = {}
+
+        # How many connections have been routed to each lobby.
+        self.routed = collections.Counter()
+
+        # How many connections the router has rejected.
+        self.rejected = 0
+
+        self.srv = None
+
+        self._lobby_tasks = {}
+        self._started     = False
+
+        # Set when closed, for 'on_start' to return without a server of our own.
+        self._closed = asyncio.Event()
+
+    def lobby(self, name):
+        return self.lobbies.get(name)
+
+    def add_lobby(self, name, lobby):
+        if name in self.lobbies:
+            raise ValueError(f"Lobby already exists: {name!r}")
+
+        self.lobbies[name] = lobby
+
+        if self._started:
+            self._start_lobby(name, lobby)
+
+        return lobby
+
+    def remove_lobby(self, name):
+        lobby = self.lobbies.pop(name)
+        lobby.close()
+
+        # Closing the lobby only stops it from accepting players.
+        for client in list(lobby.clients):
+            client.close()
+
+        task = self._lobby_tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+        self.routed.pop(name, None)
+
+        return lobby
+
+    def metrics(self):
+        return {
+            name: dict(lobby.metrics(), routed=self.routed[name])
+
+            for name, lobby in self.lobbies.items()
+        }
+
+    def _start_lobby(self, name, lobby):
+        self._lobby_tasks[name] = asyncio.create_task(lobby.start())
+
+    async def _serve_lobby(self, lobby):
+        async with lobby:
+            await lobby.on_start()
+
+    def is_serving(self):
+        return self._started
+
+    def close(self):
+        self._started = False
+        self._closed.set()
+
+        if self.srv is not None:
+            self.srv.close()
+
+        for lobby in self.lobbies.values():
+            lobby.close()
+
+        for task in self._lobby_tasks.values():
+            task.cancel()
+
+        self._lobby_tasks.clear()
+
+    async def wait_closed(self):
+        if self.srv is not None:
+            await self.srv.wait_closed()
+
+        for lobby in self.lobbies.values():
+            await lobby.wait_closed()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+        await self.wait_closed()
+
+    async def route(self, reader, writer):
+        # Returns the name of the lobby to hand the connection to.
+
+        name = self.router(self, reader, writer)
+        if inspect.isawaitable(name):
+            name = await name
+
+        return name
+
+    async def new_connection(self, reader, writer):
+        name  = await self.route(reader, writer)
+        lobby = self.lobbies.get(name)
+
+        if lobby is None:
+            self.rejected += 1
+
+            writer.close()
+            await writer.wait_closed()
+
+            return
+
+        self.routed[name] += 1
+
+        await lobby.new_connection(reader, writer)
+
+    async def open_server(self):
+        if self.use_protocol:
+            return await transport.start_server(self.new_connection, self.address, self.port)
+
+        return await asyncio.start_server(self.new_connection, self.address, self.port)
+
+    async def startup(self):
+        self._started = True
+        self._closed.clear()
+
+        # Make sure every lobby is serving before routing connections to them.
+        for name, lobby in self.lobbies.items():
+            await lobby.startup()
+
+            self._lobby_tasks[name] = asyncio.create_task(self._serve_lobby(lobby))
+
+        if self.port is not None:
+            self.srv = await self.open_server()
+
+    async def on_start(self):
+        if self.srv is not None:
+            await self.srv.serve_forever()
+
+            return
+
+        # Serve until closed.
+        await self._closed.wait()
+
+    async def start(self):
+        await self.startup()
+
+        async with self:
+            await self.on_start()
+
+    def run(self):
+        try:
+            transport.run(self.start(), use_uvloop=self.use_protocol)
+
+        except KeyboardInterrupt:
+            pass
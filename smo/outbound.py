@@ -0,0 +1,177 @@
+import asyncio
+import collections
+import enum
+
+from .packets import PlayerInfoPacket, CappyInfoPacket
+
+__all__ = [
+    "QueuePolicy",
+    "OutboundQueue",
+]
+
+class QueuePolicy(enum.Enum):
+    DropOldest = enum.auto()
+    DropNewest = enum.auto()
+    Disconnect = enum.auto()
+
+class OutboundQueue:
+    # Packets which only describe the latest state of their
+    # client, so that only the newest pending one matters.
+    state_packets = (PlayerInfoPacket, CappyInfoPacket)
+
+    def __init__(self, connection, *, max_size=None, policy=QueuePolicy.DropOldest, conflate=False, autoflush=True):
+        self.connection = connection
+
+        self.max_size = max_size
+        self.policy   = policy
+        self.conflate = conflate
+
+        # If not set, entries are only written when 'flush' is called.
+        self.autoflush = autoflush
+
+        self.dropped   = 0
+        self.conflated = 0
+
+        # Entries are '[packet, data, packet_cls, client_id]'
+        # lists so they may be replaced in place.
+        #
+        # 'packet' may be 'None' for frames which were never unpacked.
+        self._entries = collections.deque()
+
+        # Maps client IDs to the pending state entry for each packet type.
+        self._pending_state = {}
+
+        self._ready  = asyncio.Event()
+        self._task   = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _is_state_packet(self, packet_cls):
+        return self.conflate and issubclass(packet_cls, self.state_packets)
+
+    def _forget_state_entry(self, entry):
+        _, _, packet_cls, client_id = entry
+
+        pending = self._pending_state.get(client_id)
+        if pending is not None and pending.get(packet_cls) is entry:
+            del pending[packet_cls]
+
+    def _drop_oldest(self):
+        if not self.conflate:
+            self._entries.popleft()
+
+            return True
+
+        # Event packets are never dropped when conflating.
+        for entry in self._entries:
+            if self._is_state_packet(entry[2]):
+                self._entries.remove(entry)
+                self._forget_state_entry(entry)
+
+                return True
+
+        return False
+
+    def _make_room(self, is_state):
+        # Called when we're full, returning whether the new entry may still be queued.
+
+        self.dropped += 1
+
+        if self.policy is QueuePolicy.Disconnect:
+            self.connection.close()
+
+            return False
+
+        # Event packets are never dropped when conflating, so a pending state
+        # entry is dropped in their place, and if there's none left then the
+        # client is too far behind and is disconnected.
+        if self.conflate and not is_state:
+            if self._drop_oldest():
+                return True
+
+            self.connection.close()
+
+            return False
+
+        if self.policy is QueuePolicy.DropNewest:
+            return False
+
+        return self._drop_oldest()
+
+    def put(self, packet, data, *, packet_cls=None, client_id=None):
+        if self._closed:
+            return False
+
+        if packet is not None:
+            packet_cls = type(packet)
+            client_id  = packet.client_id
+
+        is_state = self._is_state_packet(packet_cls)
+
+        if is_state:
+            pending = self._pending_state.setdefault(client_id, {})
+
+            entry = pending.get(packet_cls)
+            if entry is not None:
+                entry[0] = packet
+                entry[1] = data
+
+                self.conflated += 1
+
+                return True
+
+        elif self.conflate:
+            # State packets sent after this one must
+            # not be moved in front of it.
+            self._pending_state.pop(client_id, None)
+
+        if self.max_size is not None and len(self._entries) >= self.max_size and not self._make_room(is_state):
+            return False
+
+        entry = [packet, data, packet_cls, client_id]
+        self._entries.append(entry)
+
+        if is_state:
+            pending[packet_cls] = entry
+
+        if self.autoflush:
+            self._ready.set()
+
+        return True
+
+    def flush(self):
+        if len(self._entries) > 0:
+            self._ready.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._write_entries())
+
+    def close(self):
+        self._closed = True
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        self._entries.clear()
+        self._pending_state.clear()
+
+    async def _write_entries(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+
+            entries = list(self._entries)
+            self._entries.clear()
+            self._pending_state.clear()
+
+            try:
+                await self.connection.write_packed_packets(entries)
+
+            except OSError:
+                self.connection.close()
+
+                return
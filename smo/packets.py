@@ -28,11 +28,60 @@ class Packet(pak.Packet):
         id:        pak.Int16
         size:      pak.Int16
 
+    # Incremented whenever a packet class is defined so that
+    # lookups by ID may be cached until then.
+    #
+    # Classes which are never the result of such a lookup, like those
+    # made by 'GenericPacketWithID', set '_keeps_id_lookups' in their
+    # own namespace so that defining them doesn't invalidate lookups.
+    _generation = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        if not vars(cls).get("_keeps_id_lookups", False):
+            Packet._generation += 1
+
     def __init__(self, *, client_id, ctx=None, **fields):
         super().__init__(ctx=ctx, **fields)
 
         self.client_id = client_id
 
+    # Lazy packets, as created by 'codec.lazy_packet', only have their
+    # 'client_id' until one of their fields is accessed or set, at which
+    # point all their fields are unpacked from the frame they were read from.
+
+    def _materialize(self):
+        unpack = self.__dict__.pop("_lazy_unpack")
+        del self.__dict__["_lazy_frame"]
+
+        for key, value in vars(unpack()).items():
+            self.__dict__.setdefault(key, value)
+
+    def __getattr__(self, attr):
+        # Only called when normal attribute lookup fails, like it
+        # does for the values of the fields of lazy packets.
+
+        if "_lazy_unpack" not in self.__dict__ or not attr.endswith("_type_value"):
+            raise AttributeError(f"'{type(self).__qualname__}' object has no attribute '{attr}'")
+
+        self._materialize()
+
+        return getattr(self, attr)
+
+    def __setattr__(self, attr, value):
+        # Replaces 'pak.Packet.__setattr__', which checks whether we're
+        # immutable with 'hasattr' and so would call '__getattr__'.
+
+        if "_immutable_flag" in self.__dict__:
+            raise AttributeError(f"This '{type(self).__qualname__}' instance has been made immutable")
+
+        # Setting a field would make the original frame stale.
+        if attr != "client_id" and "_lazy_unpack" in self.__dict__:
+            self._materialize()
+
+        object.__setattr__(self, attr, value)
+
     def __repr__(self):
         return "".join([
             f"{type(self).__qualname__}(",
@@ -53,6 +102,8 @@ class GenericPacket(Packet):
 def GenericPacketWithID(id):
     return type(f"GenericPacketWithID({id})", (GenericPacket,), dict(
         id = id,
+
+        _keeps_id_lookups = True,
     ))
 
 class InitPacket(Packet):
@@ -1,21 +1,38 @@
 import asyncio
+import uuid
 import pak
 from aioconsole import aprint
 
+from . import codec
+from . import transport
 from .connection import Connection
-from .packets    import Packet, PlayerConnectPacket
+from .handler    import PacketHandler
+from .outbound   import QueuePolicy
+from .packets    import Packet, InitPacket, PlayerConnectPacket
+from .upstream   import Upstream, LeastConnections
 
 __all__ = [
     "Proxy",
 ]
 
-class Proxy(pak.AsyncPacketHandler):
+class Proxy(PacketHandler):
+    # If an upstream closes a player's connection within this
+    # many seconds of it being opened, it's considered unhealthy.
+    quick_close_time = 5
+
+    # How many seconds a player has to send their first packet when greeted.
+    greet_timeout = 10
+
     class _Connection(Connection):
         # Used for the 'ServerConnection' and 'ClientConnection'
         # to depend on each other for closing.
         #
         # We make explicit calls to 'Connection' at times to avoid recursion.
 
+        # Set for the 'ServerConnection' when we've already sent the client
+        # an 'InitPacket' of our own, so that the server's isn't forwarded.
+        skip_init = False
+
         def __init__(self, proxy, *, destination=None, **kwargs):
             self.proxy       = proxy
             self.destination = destination
@@ -34,21 +51,38 @@ class Proxy(pak.AsyncPacketHandler):
             await Connection.wait_closed(self.destination)
 
     class ServerConnection(_Connection):
-        pass
+        # Set when the upstream closed the connection before we did.
+        closed_by_upstream = False
+
+        def __init__(self, proxy, *, upstream, **kwargs):
+            super().__init__(proxy, **kwargs)
+
+            self.upstream = upstream
+
+        async def _read_next_frame(self):
+            try:
+                frame = await super()._read_next_frame()
+
+            except OSError:
+                if not self.is_closing():
+                    self.closed_by_upstream = True
+
+                raise
+
+            if frame is None and not self.is_closing():
+                self.closed_by_upstream = True
+
+            return frame
 
     class ClientConnection(_Connection):
         def __init__(self, proxy, **kwargs):
             super().__init__(proxy, **kwargs)
 
-            self.proxy.clients.append(self)
+            self.proxy.clients[self] = None
 
         def close(self):
-            try:
-                self.proxy.clients.remove(self)
-
             # We might already have been closed.
-            except ValueError:
-                pass
+            self.proxy.clients.pop(self, None)
 
             super().close()
 
@@ -60,22 +94,79 @@ class Proxy(pak.AsyncPacketHandler):
         def client_id(self, value):
             self.destination.client_id = value
 
-    def __init__(self, server_address, server_port=1027, *, host_address=None, host_port=1027):
+    def __init__(
+        self,
+        server_address = None,
+        server_port    = 1027,
+        *,
+        upstreams              = None,
+        balancing              = None,
+        max_players            = 8,
+        host_address           = None,
+        host_port              = 1027,
+        outbound_queue_size    = None,
+        outbound_queue_policy  = QueuePolicy.DropOldest,
+        conflate_state_packets = False,
+        use_protocol           = False,
+        lazy_packets           = False,
+        upstream_pool_size     = 0,
+        upstream_pool_interval = 5,
+    ):
         super().__init__()
 
         self.server_address = server_address
         self.server_port    = server_port
 
+        # The servers players may be connected to, placed by the 'balancing' policy.
+        if upstreams is None:
+            upstreams = [Upstream(server_address, server_port)]
+
+        if balancing is None:
+            balancing = LeastConnections()
+
+        self.upstreams = list(upstreams)
+        self.balancing = balancing
+
+        # Sent in our own 'InitPacket' when 'balancing' needs the client ID
+        # before we connect to an upstream, which then sends its own, until
+        # we've learned what the upstreams send, see 'greeting_max_players'.
+        self.max_players = max_players
+
         self.host_address = host_address
         self.host_port    = host_port
 
-        self.srv     = None
-        self.clients = []
+        self.outbound_queue_size    = outbound_queue_size
+        self.outbound_queue_policy  = outbound_queue_policy
+        self.conflate_state_packets = conflate_state_packets
+
+        self.use_protocol = use_protocol
+        self.lazy_packets = lazy_packets
+
+        # How many connections to each upstream are opened ahead of
+        # time so that joining players don't have to wait for them.
+        #
+        # Idle connections are checked every 'upstream_pool_interval'
+        # seconds, and those the upstream has closed are replaced.
+        self.upstream_pool_size     = upstream_pool_size
+        self.upstream_pool_interval = upstream_pool_interval
+
+        for upstream in self.upstreams:
+            upstream.use_protocol  = use_protocol
+            upstream.pool_size     = upstream_pool_size
+            upstream.pool_interval = upstream_pool_interval
+
+        self.srv = None
+
+        # The keys of a dict so that they stay in the order they connected in.
+        self.clients = {}
 
     def is_serving(self):
         return self.srv is not None and self.srv.is_serving()
 
     def close(self):
+        for upstream in self.upstreams:
+            upstream.close()
+
         if self.srv is None:
             return
 
@@ -95,21 +186,50 @@ class Proxy(pak.AsyncPacketHandler):
         await self.wait_closed()
 
     async def _listen_to_packet(self, source_conn, packet):
-        async with self.listener_task_group(listen_sequentially=False) as group:
-            listeners = self.listeners_for_packet(packet)
-            async def proxy_wrapper():
+        listeners = self.listeners_for_packet(packet)
+
+        async def proxy_wrapper():
+            # Only gather when listeners can actually run concurrently.
+            if len(listeners) == 1:
+                results = [await listeners[0](source_conn, packet)]
+            else:
                 results = await asyncio.gather(*[listener(source_conn, packet) for listener in listeners])
 
-                if False not in results:
-                    await source_conn.destination.write_packet_instance(packet)
+            if False not in results:
+                await source_conn.destination.send_packet_instance(packet)
+
+        self.create_listener_task(proxy_wrapper())
+
+    async def _listen_to_frame(self, source_conn, client_id, packet_id, frame):
+        packet_cls = source_conn.packet_cls_for_id(packet_id)
+
+        if source_conn.skip_init and issubclass(packet_cls, InitPacket):
+            source_conn.skip_init = False
+
+            # Remembered for greeting later clients.
+            init = source_conn.unpack_frame(client_id, packet_id, frame)
+            source_conn.upstream.max_players = init.max_players
+
+            return
 
-            group.create_task(proxy_wrapper())
+        # Forward frames nobody listens or watches for without unpacking them.
+        if len(self.listeners_for_packet_type(packet_cls)) == 0 and not source_conn.is_watching_for_packet(packet_cls):
+            await source_conn.destination.send_frame(packet_cls, client_id, bytes(frame))
+
+            return
+
+        packet = source_conn.unpack_frame(client_id, packet_id, frame)
+
+        # Like 'continuously_read_packets' would.
+        source_conn._dispatch_to_packet_watches(packet)
+
+        await self._listen_to_packet(source_conn, packet)
 
     async def _listen_impl(self, source_conn):
         while self.is_serving() and not source_conn.is_closing():
             try:
-                async for packet in source_conn.continuously_read_packets():
-                    await self._listen_to_packet(source_conn, packet)
+                async for frame in source_conn.continuously_read_frames():
+                    await self._listen_to_frame(source_conn, *frame)
 
             finally:
                 await self.end_listener_tasks()
@@ -117,26 +237,165 @@ class Proxy(pak.AsyncPacketHandler):
     async def listen(self, client):
         await asyncio.gather(self._listen_impl(client), self._listen_impl(client.destination))
 
+    def greeting_max_players(self):
+        # The client may be placed on any upstream, so advertise the most
+        # players any of them has sent, falling back to 'max_players'.
+
+        known = [upstream.max_players for upstream in self.upstreams if upstream.max_players is not None]
+        if len(known) == 0:
+            return self.max_players
+
+        return max(known)
+
+    async def _read_first_frame(self, client_reader):
+        header = await client_reader.readexactly(codec.HEADER_SIZE)
+
+        _, _, size = codec.unpack_header(header)
+        if size < 0:
+            return None
+
+        return header + await client_reader.readexactly(size)
+
+    async def _greet_client(self, client_reader, client_writer):
+        # Stands in for the server until the client has sent its first
+        # packet, returning that packet's frame, or 'None' if it never does.
+
+        ctx  = Packet.Context()
+        init = InitPacket(client_id=uuid.UUID(int=0), max_players=self.greeting_max_players(), ctx=ctx)
+
+        client_writer.write(codec.pack_packet(init, ctx=ctx))
+        await client_writer.drain()
+
+        try:
+            return await asyncio.wait_for(self._read_first_frame(client_reader), self.greet_timeout)
+
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return None
+
+    def available_upstreams(self, *, exclude=()):
+        upstreams = [upstream for upstream in self.upstreams if upstream not in exclude]
+
+        available = [upstream for upstream in upstreams if upstream.is_available()]
+        if len(available) > 0:
+            return available
+
+        # Better to try an unhealthy upstream than to turn the player away.
+        return upstreams
+
+    async def open_upstream(self, client_id=None, *, pooled=True):
+        # Returns the chosen upstream, the streams to it, and the frame
+        # of the 'InitPacket' it sent if already read, see 'Upstream.take_streams',
+        # falling back to other upstreams if connecting fails.
+        #
+        # Without a client ID, a policy which needs one can't be used.
+
+        balancing = self.balancing
+        if client_id is None and balancing.needs_client_id:
+            balancing = LeastConnections()
+
+        tried = []
+        while True:
+            upstream = balancing.choose(self.available_upstreams(exclude=tried), client_id=client_id)
+
+            try:
+                if pooled:
+                    reader, writer, init_frame = await upstream.take_streams()
+
+                    return upstream, (reader, writer), init_frame
+
+                return upstream, await upstream.open_streams(), None
+
+            except OSError:
+                tried.append(upstream)
+
+                if len(tried) == len(self.upstreams):
+                    raise
+
     async def new_connection(self, client_reader, client_writer):
-        server_reader, server_writer = await self.open_streams()
+        first_frame = None
+        client_id   = None
+
+        if self.balancing.needs_client_id:
+            first_frame = await self._greet_client(client_reader, client_writer)
 
-        server = self.ServerConnection(self, reader=server_reader, writer=server_writer)
+            if first_frame is None:
+                client_writer.close()
+                await client_writer.wait_closed()
+
+                return
+
+            client_id = codec.frame_client_id(first_frame)
+
+        upstream, (server_reader, server_writer), init_frame = await self.open_upstream(client_id)
+
+        server = self.ServerConnection(self, upstream=upstream, reader=server_reader, writer=server_writer)
         client = self.ClientConnection(self, destination=server, reader=client_reader, writer=client_writer)
 
         server.destination = client
 
-        async with client:
-            await self.listen(client)
+        if first_frame is not None:
+            server.skip_init = True
+
+        if self.lazy_packets:
+            client.lazy_packets = True
+            server.lazy_packets = True
+
+        if self.outbound_queue_size is not None or self.conflate_state_packets:
+            for conn in (client, server):
+                conn.use_outbound_queue(
+                    self.outbound_queue_size,
+
+                    policy   = self.outbound_queue_policy,
+                    conflate = self.conflate_state_packets,
+                )
+
+        loop      = asyncio.get_running_loop()
+        opened_at = loop.time()
+
+        upstream.connections += 1
+
+        try:
+            async with client:
+                # Forwarded, or skipped, as if it had just been read.
+                if init_frame is not None:
+                    server_client_id, packet_id, _ = codec.unpack_header(init_frame)
+
+                    await self._listen_to_frame(server, server_client_id, packet_id, init_frame)
+
+                if first_frame is not None:
+                    client_id, packet_id, _ = codec.unpack_header(first_frame)
+
+                    await self._listen_to_frame(client, client_id, packet_id, first_frame)
+
+                await self.listen(client)
+
+        finally:
+            upstream.connections -= 1
+
+            # Players leaving quickly doesn't make the upstream unhealthy.
+            if server.closed_by_upstream and loop.time() - opened_at < self.quick_close_time:
+                upstream.record_failure()
+            else:
+                upstream.record_success()
 
     async def open_server(self):
+        if self.use_protocol:
+            return await transport.start_server(self.new_connection, self.host_address, self.host_port)
+
         return await asyncio.start_server(self.new_connection, self.host_address, self.host_port)
 
     async def open_streams(self):
-        return await asyncio.open_connection(self.server_address, self.server_port)
+        # Pooled connections have had their 'InitPacket' read already.
+        _, streams, _ = await self.open_upstream(pooled=False)
+
+        return streams
 
     async def startup(self):
         self.srv = await self.open_server()
 
+        for upstream in self.upstreams:
+            upstream.start()
+
     async def on_start(self):
         await self.srv.serve_forever()
 
@@ -148,7 +407,7 @@ class Proxy(pak.AsyncPacketHandler):
 
     def run(self):
         try:
-            asyncio.run(self.start())
+            transport.run(self.start(), use_uvloop=self.use_protocol)
 
         except KeyboardInterrupt:
             self.close()
@@ -1,35 +1,101 @@
 import asyncio
+import functools
 import pak
 
+from . import codec
+from . import transport
 from .connection import Connection
+from .dispatch   import DispatchOrder
+from .handler    import PacketHandler
+from .outbound   import QueuePolicy
+from .spatial    import SpatialIndex
 from .packets import (
     Packet,
     InitPacket,
+    PlayerInfoPacket,
+    CappyInfoPacket,
     PlayerConnectPacket,
     PlayerDisconnectPacket,
     GameInfoPacket,
     CostumeInfoPacket,
+    CaptureInfoPacket,
     ServerCommandPacket,
     ShineCollectPacket,
+    TagInfoPacket,
 )
 
 __all__ = [
     "Server",
 ]
 
-class Server(pak.AsyncPacketHandler):
+class _HandoffServer:
+    # Stands in for an 'asyncio.Server' when a 'Server' doesn't listen
+    # itself, and connections are instead handed to its 'new_connection'.
+
+    def __init__(self):
+        self._closed = asyncio.Event()
+
+    def is_serving(self):
+        return not self._closed.is_set()
+
+    def close(self):
+        self._closed.set()
+
+    async def wait_closed(self):
+        pass
+
+    async def serve_forever(self):
+        await self._closed.wait()
+
+# Within the body of 'Server', 'Connection' is 'Server.Connection'.
+_BaseConnection = Connection
+
+class Server(PacketHandler):
+    # Frequent packets only relevant to clients in the same stage.
+    movement_packets = (PlayerInfoPacket, CappyInfoPacket, CaptureInfoPacket)
+
+    # Packets which may be sent less often to far away clients.
+    thinned_packets = (PlayerInfoPacket, CappyInfoPacket)
+
+    # The latest of each of these packets from a client
+    # is sent to players who join after it, in this order.
+    snapshot_packets = (
+        GameInfoPacket,
+        PlayerConnectPacket,
+        CostumeInfoPacket,
+        PlayerInfoPacket,
+        CaptureInfoPacket,
+        TagInfoPacket,
+    )
+
     class Connection(Connection):
         def __init__(self, server, **kwargs):
             super().__init__(**kwargs)
 
             self.server = server
-            self.server.clients.append(self)
+            self.server.clients[self] = None
 
             self.name = None
 
             self.game_info    = None
             self.costume_info = None
 
+            # The stage we're indexed under for interest management.
+            self.stage = None
+
+            # The latest movement packets we've sent, by type.
+            self.movement = {}
+
+            # The stage whose spatial index we're in.
+            self.spatial_stage = None
+
+            # How many of each thinned packet we've broadcast.
+            self.update_counts = {}
+
+            # Maps packet types to the latest '(packet, data)' pair
+            # we've sent of them, for players who join later.
+            self.snapshot = {}
+
         @property
         def connected(self):
             return self.name is not None
@@ -44,14 +110,137 @@ class Server(pak.AsyncPacketHandler):
 
             await self.broadcast_packet_instance(packet)
 
-        async def broadcast_packet_instance(self, packet):
-            for other_client in self.server.connected_clients:
+        def remember_state(self, packet):
+            # Packs 'packet' and stores it in our snapshot, returning its data.
+
+            data = self.pack_packet(packet)
+            self.snapshot[type(packet)] = (packet, data)
+
+            return data
+
+        def snapshot_entries(self, *, exclude=()):
+            for packet_cls in self.server.snapshot_packets:
+                if issubclass(packet_cls, exclude):
+                    continue
+
+                entry = self.snapshot.get(packet_cls)
+                if entry is not None:
+                    yield entry
+
+        async def broadcast_packet_instance(self, packet, data=None):
+            # Only pack the packet once for all recipients.
+
+            for other_client in self.server.recipients_for_packet(self, packet):
                 if other_client is self:
                     continue
 
-                await other_client.write_packet_instance(packet)
+                if data is None:
+                    data = self.pack_packet(packet)
+
+                await other_client.send_packed_packet(packet, data)
+
+            if len(self.server.peer_links) > 0:
+                if data is None:
+                    data = self.pack_packet(packet)
+
+                await self.server.relay_to_peers(packet, data)
+
+        async def broadcast_frame(self, packet_cls, frame):
+            # Broadcasts an already-serialized frame as coming from us,
+            # re-stamping only its header if needed.
+            #
+            # Recipients are chosen and our snapshot is kept like for any other
+            # broadcast, using a lazy packet which only unpacks the frame if needed.
+
+            if codec.frame_client_id(frame) != self.client_id:
+                frame = codec.restamp_frame(frame, self.client_id)
+
+            frame  = bytes(frame)
+            packet = codec.lazy_packet(packet_cls, frame, client_id=self.client_id, ctx=self.ctx)
 
-    def __init__(self, *, address=None, port=1027, max_players=8):
+            if issubclass(packet_cls, self.server.snapshot_packets):
+                self.snapshot[packet_cls] = (packet, frame)
+
+            await self.broadcast_packet_instance(packet, frame)
+
+    class PeerLink(_BaseConnection):
+        # A link to another server hosting the same lobby.
+        #
+        # Each server relays what its own clients broadcast over the
+        # link, and broadcasts what it receives to its own clients.
+
+        def __init__(self, server, **kwargs):
+            super().__init__(**kwargs)
+
+            self.server = server
+
+            # Maps client IDs to the 'RemoteClient's of the other server.
+            self.remote_clients = {}
+
+            # Relayed packets are small and frequent, so batch them.
+            self.auto_cork = True
+
+    class RemoteClient:
+        # A client connected to another server, as seen through a 'PeerLink'.
+        #
+        # What it sends is broadcast to our clients like what our own
+        # clients send, so it's tracked with the same attributes.
+
+        def __init__(self, link, client_id):
+            self.link      = link
+            self.client_id = client_id
+
+            self.name = None
+
+            self.game_info = None
+
+            self.stage         = None
+            self.movement      = {}
+            self.spatial_stage = None
+            self.update_counts = {}
+
+            # Like 'Server.Connection.snapshot', but with lazy packets of the relayed frames.
+            self.snapshot = {}
+
+        @property
+        def connected(self):
+            return self.name is not None
+
+        def snapshot_entries(self, *, exclude=()):
+            for packet_cls in self.link.server.snapshot_packets:
+                if issubclass(packet_cls, exclude):
+                    continue
+
+                entry = self.snapshot.get(packet_cls)
+                if entry is not None:
+                    yield entry
+
+    def __init__(
+        self,
+        *,
+        address                = None,
+        port                   = 1027,
+        max_players            = 8,
+        outbound_queue_size    = None,
+        outbound_queue_policy  = QueuePolicy.DropOldest,
+        conflate_state_packets = False,
+        interest_management    = False,
+        spatial_cell_size      = 1000.0,
+        distance_bands         = None,
+        tick_rate              = None,
+        auto_cork              = False,
+        use_protocol           = False,
+        lazy_packets           = False,
+        dispatch_queue_size    = None,
+        dispatch_order         = DispatchOrder.FIFO,
+        reuse_port             = False,
+        peer_path              = None,
+        peer_paths             = (),
+        peer_address           = None,
+        peer_port              = None,
+        peers                  = (),
+        peer_retry_interval    = 1,
+    ):
         super().__init__()
 
         self.address = address
@@ -59,19 +248,121 @@ class Server(pak.AsyncPacketHandler):
 
         self.max_players = max_players
 
-        self.srv     = None
-        self.clients = []
+        # If not 'None', each client gets its own bounded queue
+        # of outgoing packets so a slow client can't hold up broadcasts.
+        self.outbound_queue_size   = outbound_queue_size
+        self.outbound_queue_policy = outbound_queue_policy
+
+        # Whether only the newest pending state packet, like 'PlayerInfoPacket',
+        # from each client should be kept in the outbound queues.
+        self.conflate_state_packets = conflate_state_packets
+
+        # Whether movement packets should only be sent to clients in the same stage.
+        self.interest_management = interest_management
+
+        # If not 'None', a 'DistanceBands' which thins out
+        # movement packets sent to far away clients.
+        self.distance_bands = distance_bands
+
+        self.spatial_cell_size = spatial_cell_size
+
+        # If not 'None', broadcasts are accumulated in each client's
+        # outbound queue and written out this many times per second.
+        self.tick_rate  = tick_rate
+        self._tick_task = None
+
+        # Whether clients should batch writes issued in the same iteration of the event loop.
+        self.auto_cork = auto_cork
+
+        # Whether to use 'transport.PacketProtocol' instead of asyncio streams.
+        self.use_protocol = use_protocol
+
+        # Whether clients should only unpack packets' fields when they're accessed.
+        self.lazy_packets = lazy_packets
+
+        # If not 'None', packets read from each client are dispatched to
+        # listeners from a bounded queue so that slow listeners don't hold
+        # up reading, see 'DispatchQueue'.
+        self.dispatch_queue_size = dispatch_queue_size
+        self.dispatch_order      = dispatch_order
+
+        # Whether other processes may listen on the same port, see 'workers.run_workers'.
+        self.reuse_port = reuse_port
+
+        # Other servers hosting the same lobby are linked over Unix sockets or TCP.
+        #
+        # We listen for links on 'peer_path' and on 'peer_address' and
+        # 'peer_port', and connect to each of 'peer_paths' and of 'peers',
+        # which are '(host, port)' pairs, retrying every 'peer_retry_interval'
+        # seconds until connected or whenever the link is lost.
+        #
+        # Only one server of each linked pair should connect to the other.
+        self.peer_path           = peer_path
+        self.peer_paths          = peer_paths
+        self.peer_address        = peer_address
+        self.peer_port           = peer_port
+        self.peers               = peers
+        self.peer_retry_interval = peer_retry_interval
+
+        self._peer_srvs  = []
+        self._peer_tasks = set()
+
+        # The keys of a dict like 'clients'.
+        self.peer_links = {}
+
+        # Maps client IDs to the 'RemoteClient's of every linked server.
+        self._remote_clients = {}
+
+        self.srv = None
+
+        # Every client, connected or not, as the keys of a dict so
+        # that they stay in the order they connected in.
+        self.clients = {}
+
+        # The connected clients. This is a tuple which is replaced, not
+        # mutated, so that broadcasts may iterate over it while awaiting.
+        self._connected_clients = ()
+
+        # Maps client IDs to connected clients.
+        self._clients_by_id = {}
+
+        # Maps stage names to the connected clients in them.
+        self._stage_clients = {}
+
+        # Like '_stage_clients', but for the clients of linked servers.
+        self._remote_stage_clients = {}
+
+        # Maps stage names to the 'SpatialIndex' of the clients in them.
+        self._spatial_indices = {}
 
     def is_serving(self):
         return self.srv is not None and self.srv.is_serving()
 
     def close(self):
+        if self._tick_task is not None:
+            self._tick_task.cancel()
+            self._tick_task = None
+
+        for task in self._peer_tasks:
+            task.cancel()
+
+        self._peer_tasks.clear()
+
+        for link in list(self.peer_links):
+            link.close()
+
+        for peer_srv in self._peer_srvs:
+            peer_srv.close()
+
         if self.srv is None:
             return
 
         self.srv.close()
 
     async def wait_closed(self):
+        for peer_srv in self._peer_srvs:
+            await peer_srv.wait_closed()
+
         if self.srv is None:
             return
 
@@ -85,21 +376,87 @@ class Server(pak.AsyncPacketHandler):
         await self.wait_closed()
 
     async def _listen_to_packet(self, client, packet):
-        async with self.listener_task_group(listen_sequentially=not client.connected) as group:
-            for listener in self.listeners_for_packet(packet):
-                group.create_task(listener(client, packet))
+        await self.call_listeners(
+            self.listeners_for_packet(packet),
+
+            client,
+            packet,
+
+            listen_sequentially = not client.connected,
+        )
+
+    async def _dispatch_packet(self, client, packet):
+        # Packets from the dispatch queue are listened to sequentially
+        # so that the queue's ordering and bounds apply to the listeners.
+
+        await self.call_listeners(
+            self.listeners_for_packet(packet),
+
+            client,
+            packet,
+
+            listen_sequentially = True,
+        )
+
+    def _on_packet(self, client, packet):
+        # Returns what reading must wait for before the next packet, if anything.
+
+        # Packets are dispatched inline until the client has connected.
+        if not client.connected:
+            return self._listen_to_packet(client, packet)
+
+        if client.dispatch_queue is not None:
+            if client.dispatch_queue.is_full():
+                return client.dispatch_queue.put(packet)
+
+            client.dispatch_queue.put_nowait(packet)
+
+            return None
+
+        # Each listener runs in its own task, so there's nothing to wait for.
+        self.create_listener_tasks(self.listeners_for_packet(packet), client, packet)
+
+        return None
 
     async def listen(self, client):
         while self.is_serving() and not client.is_closing():
             try:
-                async for packet in client.continuously_read_packets():
-                    await self._listen_to_packet(client, packet)
+                await client.receive_packets(functools.partial(self._on_packet, client))
+
+                if client.dispatch_queue is not None:
+                    await client.dispatch_queue.join()
 
             finally:
+                if client.dispatch_queue is not None:
+                    client.dispatch_queue.close()
+
                 await self.end_listener_tasks()
 
     async def new_connection(self, reader, writer):
         async with self.Connection(self, reader=reader, writer=writer) as client:
+            if self.auto_cork:
+                client.auto_cork = True
+
+            if self.lazy_packets:
+                client.lazy_packets = True
+
+            if self.outbound_queue_size is not None or self.conflate_state_packets or self.tick_rate is not None:
+                client.use_outbound_queue(
+                    self.outbound_queue_size,
+
+                    policy    = self.outbound_queue_policy,
+                    conflate  = self.conflate_state_packets,
+                    autoflush = self.tick_rate is None,
+                )
+
+            if self.dispatch_queue_size is not None:
+                client.use_dispatch_queue(
+                    functools.partial(self._dispatch_packet, client),
+
+                    max_size = self.dispatch_queue_size,
+                    order    = self.dispatch_order,
+                )
+
             await client.write_packet(
                 InitPacket,
 
@@ -109,11 +466,48 @@ class Server(pak.AsyncPacketHandler):
             await self.listen(client)
 
     async def open_server(self):
-        return await asyncio.start_server(self.new_connection, self.address, self.port)
+        # Without a port, connections must be handed to us, like by a 'LobbyManager'.
+        if self.port is None:
+            return _HandoffServer()
+
+        if self.use_protocol:
+            return await transport.start_server(self.new_connection, self.address, self.port, reuse_port=self.reuse_port)
+
+        return await asyncio.start_server(self.new_connection, self.address, self.port, reuse_port=self.reuse_port)
+
+    async def _tick(self):
+        loop     = asyncio.get_running_loop()
+        interval = 1 / self.tick_rate
+
+        next_tick = loop.time()
+        while True:
+            next_tick += interval
+
+            # Don't try to catch up on ticks we've missed.
+            now = loop.time()
+            if next_tick < now:
+                next_tick = now
+
+            await asyncio.sleep(next_tick - now)
+
+            for client in self.clients:
+                if client.outbound is not None:
+                    client.outbound.flush()
 
     async def startup(self):
         self.srv = await self.open_server()
 
+        if self.tick_rate is not None:
+            self._tick_task = asyncio.create_task(self._tick())
+
+        self._peer_srvs = await self.open_peer_servers()
+
+        for peer in (*self.peer_paths, *self.peers):
+            task = asyncio.create_task(self._connect_to_peer(peer))
+            task.add_done_callback(self._peer_tasks.discard)
+
+            self._peer_tasks.add(task)
+
     async def on_start(self):
         await self.srv.serve_forever()
 
@@ -125,20 +519,374 @@ class Server(pak.AsyncPacketHandler):
 
     def run(self):
         try:
-            asyncio.run(self.start())
+            transport.run(self.start(), use_uvloop=self.use_protocol)
 
         except KeyboardInterrupt:
             pass
 
     @property
     def connected_clients(self):
-        return [client for client in self.clients if client.connected]
+        return self._connected_clients
+
+    @property
+    def player_count(self):
+        # Includes the players connected to linked servers.
+
+        return len(self.connected_clients) + sum(1 for remote_client in self._remote_clients.values() if remote_client.connected)
+
+    def metrics(self):
+        outbound_queues = [client.outbound       for client in self.clients if client.outbound       is not None]
+        dispatch_queues = [client.dispatch_queue for client in self.clients if client.dispatch_queue is not None]
+
+        return dict(
+            clients         = len(self.clients),
+            players         = self.player_count,
+            peer_links      = len(self.peer_links),
+            outbound_depth  = sum(len(queue) for queue in outbound_queues),
+            dropped         = sum(queue.dropped   for queue in outbound_queues),
+            conflated       = sum(queue.conflated for queue in outbound_queues),
+            dispatch_depth  = sum(len(queue) for queue in dispatch_queues),
+            dispatch_stalls = sum(queue.stalls for queue in dispatch_queues),
+        )
+
+    def client_for_id(self, client_id):
+        return self._clients_by_id.get(client_id)
+
+    def _forget_client_id(self, client):
+        if self._clients_by_id.get(client.client_id) is client:
+            del self._clients_by_id[client.client_id]
+
+    def _connect_client(self, client, client_id, name):
+        if client.connected:
+            self._forget_client_id(client)
+
+        else:
+            self._connected_clients += (client,)
+
+        client.client_id = client_id
+        client.name      = name
+
+        self._clients_by_id[client_id] = client
+
+    def _remove_client(self, client):
+        del self.clients[client]
+
+        if client.connected:
+            self._forget_client_id(client)
+
+            self._connected_clients = tuple(other for other in self._connected_clients if other is not client)
+
+    def clients_in_stage(self, stage):
+        return self._stage_clients.get(stage, ())
+
+    def remote_clients_in_stage(self, stage):
+        return self._remote_stage_clients.get(stage, ())
+
+    def recipients_for_packet(self, client, packet):
+        if self.interest_management and client.stage is not None and isinstance(packet, self.movement_packets):
+            # Remember it for clients who later enter the stage.
+            client.movement[type(packet)] = packet
+
+            recipients = self.clients_in_stage(client.stage)
+
+        else:
+            recipients = self.connected_clients
+
+        if self.distance_bands is not None and isinstance(packet, self.thinned_packets):
+            return self._thin_recipients(client, packet, recipients)
+
+        return recipients
+
+    def spatial_index(self, stage):
+        return self._spatial_indices.get(stage)
+
+    def clients_near(self, client, radius):
+        index = self.spatial_index(client.spatial_stage)
+        if index is None or client not in index:
+            return []
+
+        return [other_client for other_client in index.within(index.position(client), radius) if other_client is not client]
+
+    def _update_position(self, client, position):
+        stage = None if client.game_info is None else client.game_info.stage_name
+
+        if stage != client.spatial_stage:
+            self._remove_position(client)
+
+            client.spatial_stage = stage
+
+        index = self._spatial_indices.get(stage)
+        if index is None:
+            index = SpatialIndex(self.spatial_cell_size)
+
+            self._spatial_indices[stage] = index
+
+        index.update(client, position)
+
+    def _remove_position(self, client):
+        index = self._spatial_indices.get(client.spatial_stage)
+        if index is None:
+            return
+
+        index.remove(client)
+
+        if len(index) == 0:
+            del self._spatial_indices[client.spatial_stage]
+
+        client.spatial_stage = None
+
+    def _thin_recipients(self, client, packet, recipients):
+        # Each client's n-th update is only sent to
+        # recipients whose band's interval divides n.
+        #
+        # The recipients are chosen up front, since the spatial index
+        # may grow or reuse rows while the broadcast is awaiting.
+
+        packet_cls = type(packet)
+
+        count = client.update_counts.get(packet_cls, 0) + 1
+        client.update_counts[packet_cls] = count
+
+        index = self.spatial_index(client.spatial_stage)
+        if index is None or client not in index:
+            return recipients
+
+        distances = index.distances_from(client)
+
+        thinned = []
+        for other_client in recipients:
+            row = index.row(other_client)
+
+            if row is None:
+                interval = self.distance_bands.far_interval
+            else:
+                interval = self.distance_bands.interval_for(distances[row])
+
+            if count % interval == 0:
+                thinned.append(other_client)
+
+        return thinned
+
+    def _index_stage(self, client, stage, stage_clients=None):
+        # Stages map to tuples which are replaced, not mutated,
+        # so that broadcasts may iterate over them while awaiting.
+
+        if stage_clients is None:
+            stage_clients = self._stage_clients
+
+        if client.stage is not None:
+            remaining = tuple(other for other in stage_clients[client.stage] if other is not client)
+
+            if len(remaining) > 0:
+                stage_clients[client.stage] = remaining
+            else:
+                del stage_clients[client.stage]
+
+        if stage is not None:
+            stage_clients[stage] = stage_clients.get(stage, ()) + (client,)
+
+        client.stage = stage
+
+    async def _enter_stage(self, client, stage):
+        if not self.interest_management or not client.connected or client.stage == stage:
+            return
+
+        self._index_stage(client, stage)
+
+        # Our previous movement is meaningless in the new stage.
+        client.movement.clear()
+
+        # Catch up on the movement we've missed from the clients already there.
+        for other_client in (*self.clients_in_stage(stage), *self.remote_clients_in_stage(stage)):
+            if other_client is client:
+                continue
+
+            for packet in list(other_client.movement.values()):
+                await client.send_packet_instance(packet)
 
     async def on_disconnect(self, client):
+        if client.stage is not None:
+            self._index_stage(client, None)
+
+        self._remove_position(client)
+
         if client in self.clients:
             await client.broadcast_packet(PlayerDisconnectPacket)
 
-            self.clients.remove(client)
+            # We might have been removed while broadcasting.
+            if client in self.clients:
+                self._remove_client(client)
+
+    async def open_peer_servers(self):
+        peer_srvs = []
+
+        if self.peer_path is not None:
+            peer_srvs.append(await asyncio.start_unix_server(self._new_peer_connection, self.peer_path))
+
+        if self.peer_port is not None:
+            peer_srvs.append(await asyncio.start_server(self._new_peer_connection, self.peer_address, self.peer_port))
+
+        return peer_srvs
+
+    async def open_peer_streams(self, peer):
+        # Peers are either Unix socket paths or '(host, port)' pairs.
+        if isinstance(peer, str):
+            return await asyncio.open_unix_connection(peer)
+
+        host, port = peer
+
+        return await asyncio.open_connection(host, port)
+
+    def _report_peer_error(self, exc, peer=None):
+        message = "Unexpected error in peer link"
+        if peer is not None:
+            message += f" to {peer!r}"
+
+        asyncio.get_running_loop().call_exception_handler(dict(
+            message   = message,
+            exception = exc,
+        ))
+
+    async def _new_peer_connection(self, reader, writer):
+        try:
+            await self.link_peer(reader, writer)
+
+        # The link being lost is handled like any other.
+        except OSError:
+            pass
+
+        except Exception as e:
+            self._report_peer_error(e)
+
+    async def _connect_to_peer(self, peer):
+        while True:
+            try:
+                reader, writer = await self.open_peer_streams(peer)
+
+                await self.link_peer(reader, writer)
+
+            except OSError:
+                pass
+
+            # Keep retrying so that a bug in one link doesn't silently stop linking.
+            except Exception as e:
+                self._report_peer_error(e, peer)
+
+            await asyncio.sleep(self.peer_retry_interval)
+
+    async def link_peer(self, reader, writer):
+        async with self.PeerLink(self, reader=reader, writer=writer) as link:
+            self.peer_links[link] = None
+
+            try:
+                # Catch the other server up on our clients.
+                entries = []
+                for client in self.connected_clients:
+                    entries.extend(client.snapshot_entries())
+
+                if len(entries) > 0:
+                    await link.write_packed_packets(entries)
+
+                async for client_id, packet_id, frame in link.continuously_read_frames():
+                    await self._on_peer_frame(link, link.packet_cls_for_id(packet_id), client_id, bytes(frame))
+
+            finally:
+                del self.peer_links[link]
+
+                await self._unlink_remote_clients(link)
+
+    async def relay_to_peers(self, packet, data):
+        for link in tuple(self.peer_links):
+            try:
+                await link.send_packed_packet(packet, data)
+
+            except OSError:
+                link.close()
+
+    async def _broadcast_peer_frame(self, packet_cls, client_id, frame, recipients=None):
+        if recipients is None:
+            recipients = self.connected_clients
+
+        for client in recipients:
+            await client.send_frame(packet_cls, client_id, frame)
+
+    def _enter_remote_stage(self, remote_client, stage):
+        # Our clients entering the stage later catch up on the
+        # remote client's movement, see '_enter_stage'. The remote
+        # client itself is caught up by its own server.
+
+        if not self.interest_management or remote_client.stage == stage:
+            return
+
+        self._index_stage(remote_client, stage, self._remote_stage_clients)
+
+        remote_client.movement.clear()
+
+    def _forget_remote_client(self, remote_client):
+        if self._remote_clients.get(remote_client.client_id) is remote_client:
+            del self._remote_clients[remote_client.client_id]
+
+        if remote_client.stage is not None:
+            self._index_stage(remote_client, None, self._remote_stage_clients)
+
+        self._remove_position(remote_client)
+
+    async def _on_peer_frame(self, link, packet_cls, client_id, frame):
+        if issubclass(packet_cls, PlayerDisconnectPacket):
+            remote_client = link.remote_clients.pop(client_id, None)
+
+            if remote_client is not None:
+                self._forget_remote_client(remote_client)
+
+            await self._broadcast_peer_frame(packet_cls, client_id, frame)
+
+            return
+
+        remote_client = link.remote_clients.get(client_id)
+        if remote_client is None:
+            remote_client = self.RemoteClient(link, client_id)
+
+            link.remote_clients[client_id] = remote_client
+            self._remote_clients[client_id] = remote_client
+
+        # Only unpacked if needed to choose recipients.
+        packet = codec.lazy_packet(packet_cls, frame, client_id=client_id, ctx=link.ctx)
+
+        if issubclass(packet_cls, self.snapshot_packets):
+            remote_client.snapshot[packet_cls] = (packet, frame)
+
+        if issubclass(packet_cls, PlayerConnectPacket):
+            remote_client.name = packet.name
+
+            # Like with our own clients, connecting isn't broadcast.
+            return
+
+        # Like our 'main_listener' does for our own clients.
+        if issubclass(packet_cls, PlayerInfoPacket):
+            self._update_position(remote_client, packet.position)
+
+        elif issubclass(packet_cls, GameInfoPacket):
+            remote_client.game_info = packet
+
+        await self._broadcast_peer_frame(packet_cls, client_id, frame, self.recipients_for_packet(remote_client, packet))
+
+        if issubclass(packet_cls, GameInfoPacket):
+            self._enter_remote_stage(remote_client, packet.stage_name)
+
+    async def _unlink_remote_clients(self, link):
+        # The clients of a lost link disconnect from our clients' point of view.
+
+        remote_clients = list(link.remote_clients.values())
+        link.remote_clients.clear()
+
+        for remote_client in remote_clients:
+            self._forget_remote_client(remote_client)
+
+            packet = PlayerDisconnectPacket(client_id=remote_client.client_id, ctx=link.ctx)
+            data   = link.pack_packet(packet)
+
+            for client in self.connected_clients:
+                await client.send_packed_packet(packet, data)
 
     async def handle_command(self, client, command):
         pass
@@ -149,44 +897,74 @@ class Server(pak.AsyncPacketHandler):
 
     @main_listener.derived_listener(PlayerConnectPacket)
     async def main_listener(self, client, packet):
-        if len(self.connected_clients) >= self.max_players:
+        if self.player_count >= self.max_players:
             client.close()
             await client.wait_closed()
 
             return
 
-        client.client_id = packet.client_id
-        client.name      = packet.name
+        self._connect_client(client, packet.client_id, packet.name)
+
+        connect_packet = client.create_packet(
+            PlayerConnectPacket,
+
+            max_players = self.max_players,
+            name        = client.name,
+        )
+
+        connect_data = client.remember_state(connect_packet)
 
+        # Connecting isn't broadcast, but linked servers must know of it.
+        await self.relay_to_peers(connect_packet, connect_data)
+
+        # With interest management, movement is caught up on when entering a stage.
+        exclude = self.movement_packets if self.interest_management else ()
+
+        entries = []
         for other_client in self.connected_clients:
             if other_client is client:
                 continue
 
-            if other_client.game_info is not None:
-                await client.write_packet_instance(other_client.game_info)
+            entries.extend(other_client.snapshot_entries(exclude=exclude))
 
-            await client.write_packet(
-                PlayerConnectPacket,
+        for remote_client in self._remote_clients.values():
+            if remote_client.connected:
+                entries.extend(remote_client.snapshot_entries(exclude=exclude))
 
-                client      = other_client,
-                max_players = self.max_players,
-                name        = other_client.name,
-            )
+        # Everything already packed is written all at once.
+        if len(entries) > 0:
+            await client.write_packed_packets(entries)
+
+        if client.game_info is not None:
+            await self._enter_stage(client, client.game_info.stage_name)
+
+    @main_listener.derived_listener(PlayerInfoPacket)
+    async def main_listener(self, client, packet):
+        self._update_position(client, packet.position)
 
-            if other_client.costume_info is not None:
-                await client.write_packet_instance(other_client.costume_info)
+        await client.broadcast_packet_instance(packet, client.remember_state(packet))
 
     @main_listener.derived_listener(GameInfoPacket)
     async def main_listener(self, client, packet):
         client.game_info = packet
 
-        await client.broadcast_packet_instance(packet)
+        await client.broadcast_packet_instance(packet, client.remember_state(packet))
+
+        await self._enter_stage(client, packet.stage_name)
 
     @main_listener.derived_listener(CostumeInfoPacket)
     async def main_listener(self, client, packet):
         client.costume_info = packet
 
-        await client.broadcast_packet_instance(packet)
+        await client.broadcast_packet_instance(packet, client.remember_state(packet))
+
+    @main_listener.derived_listener(CaptureInfoPacket)
+    async def main_listener(self, client, packet):
+        await client.broadcast_packet_instance(packet, client.remember_state(packet))
+
+    @main_listener.derived_listener(TagInfoPacket)
+    async def main_listener(self, client, packet):
+        await client.broadcast_packet_instance(packet, client.remember_state(packet))
 
     @main_listener.derived_listener(ServerCommandPacket)
     async def main_listener(self, client, packet):
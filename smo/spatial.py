@@ -0,0 +1,130 @@
+import bisect
+import numpy as np
+
+__all__ = [
+    "SpatialIndex",
+    "DistanceBands",
+]
+
+class SpatialIndex:
+    # A uniform grid over the positions of arbitrary keys.
+    #
+    # Positions and grid cells are stored in rows of NumPy
+    # arrays so that updates are a single row assignment
+    # and queries are vectorized over every key.
+
+    def __init__(self, cell_size=1000.0, *, capacity=16):
+        self.cell_size = cell_size
+
+        self._rows = {}
+        self._keys = [None] * capacity
+        self._free = list(reversed(range(capacity)))
+
+        self._positions = np.zeros((capacity, 3))
+        self._cells     = np.zeros((capacity, 3), dtype=np.int64)
+        self._active    = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def _grow(self):
+        old_capacity = len(self._keys)
+        new_capacity = 2 * old_capacity
+
+        self._keys.extend([None] * old_capacity)
+        self._free.extend(reversed(range(old_capacity, new_capacity)))
+
+        self._positions = np.resize(self._positions, (new_capacity, 3))
+        self._cells     = np.resize(self._cells,     (new_capacity, 3))
+
+        active = np.zeros(new_capacity, dtype=bool)
+        active[:old_capacity] = self._active
+
+        self._active = active
+
+    def row(self, key):
+        return self._rows.get(key)
+
+    def position(self, key):
+        return self._positions[self._rows[key]].copy()
+
+    def update(self, key, position):
+        row = self._rows.get(key)
+
+        if row is None:
+            if len(self._free) == 0:
+                self._grow()
+
+            row = self._free.pop()
+
+            self._rows[key] = row
+            self._keys[row] = key
+
+            self._active[row] = True
+
+        self._positions[row] = position
+        self._cells[row]     = self._positions[row] // self.cell_size
+
+    def remove(self, key):
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+
+        self._keys[row]   = None
+        self._active[row] = False
+
+        self._free.append(row)
+
+    def distances_from(self, key):
+        # Returns the distances from 'key' to every row, indexable by 'row'.
+
+        deltas = self._positions - self._positions[self._rows[key]]
+
+        return np.sqrt(np.einsum("ij,ij->i", deltas, deltas))
+
+    def distance(self, key, other_key):
+        return float(np.linalg.norm(self._positions[self._rows[key]] - self._positions[self._rows[other_key]]))
+
+    def within(self, center, radius):
+        center = np.asarray(center, dtype=np.float64)
+
+        low_cell  = (center - radius) // self.cell_size
+        high_cell = (center + radius) // self.cell_size
+
+        candidates = self._active & (self._cells >= low_cell).all(axis=1) & (self._cells <= high_cell).all(axis=1)
+        rows       = np.flatnonzero(candidates)
+
+        deltas = self._positions[rows] - center
+        rows   = rows[np.einsum("ij,ij->i", deltas, deltas) <= radius * radius]
+
+        return [self._keys[row] for row in rows]
+
+class DistanceBands:
+    # Maps distances to how often updates should be sent.
+    #
+    # 'bands' is a sequence of '(max_distance, interval)' pairs,
+    # where only every 'interval'-th update is sent to recipients
+    # closer than 'max_distance'. Recipients past every band, or
+    # whose distance is unknown, use 'far_interval'.
+
+    def __init__(self, bands=((2000.0, 1), (6000.0, 2)), *, far_interval=4):
+        bands = sorted(bands)
+
+        self._distances = [distance for distance, interval in bands]
+        self._intervals = [interval for distance, interval in bands]
+
+        self.far_interval = far_interval
+
+    def interval_for(self, distance):
+        band = bisect.bisect_left(self._distances, distance)
+
+        if band >= len(self._intervals):
+            return self.far_interval
+
+        return self._intervals[band]
@@ -0,0 +1,444 @@
+import asyncio
+import collections
+
+from . import codec
+
+try:
+    import uvloop
+
+except ImportError:
+    uvloop = None
+
+__all__ = [
+    "ReceiveBuffer",
+    "PacketProtocol",
+    "ProtocolWriter",
+    "open_connection",
+    "start_server",
+    "run",
+]
+
+class ReceiveBuffer:
+    # Received data, which is appended at 'end' and consumed from 'start'.
+
+    def __init__(self, size):
+        self.data  = bytearray(size)
+        self.view  = memoryview(self.data)
+        self.start = 0
+        self.end   = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def clear(self):
+        self.start = 0
+        self.end   = 0
+
+    def compact(self):
+        # Moves the unconsumed data to the front of the buffer.
+
+        if self.start == 0:
+            return
+
+        remaining = self.end - self.start
+
+        self.view[:remaining] = self.view[self.start:self.end]
+
+        self.start = 0
+        self.end   = remaining
+
+    def is_full(self):
+        return self.end == len(self.data)
+
+    def next_frame(self):
+        # Consumes the next whole frame, returning its client ID, packet ID
+        # and a view of it, or 'None' if it hasn't been fully received yet.
+        #
+        # The view is only valid until the buffer is compacted.
+
+        start = self.start
+
+        if self.end - start < codec.HEADER_SIZE:
+            return None
+
+        client_id, packet_id, size = codec.unpack_header(self.data, start)
+        if size < 0:
+            raise ValueError(f"Invalid packet size: {size}")
+
+        end = start + codec.HEADER_SIZE + size
+        if end > self.end:
+            return None
+
+        self.start = end
+
+        return client_id, packet_id, self.view[start:end]
+
+class PacketProtocol(asyncio.BufferedProtocol):
+    # A lighter alternative to 'asyncio.StreamReader'.
+    #
+    # Data is received straight into a 'ReceiveBuffer'. Connections
+    # hand over their own with 'receive_frames', which then parses
+    # frames as soon as they're received and hands them to a callback,
+    # without a reading loop in between. Connections may instead read
+    # from us in a loop with 'receive_into'.
+    #
+    # The buffer is only compacted when the frames in it have been
+    # handled or more data is asked for, so that views of consumed
+    # data stay valid until then.
+
+    # Only holds what's received before a connection hands over its buffer.
+    _initial_buffer_size = 0x1000
+
+    def __init__(self, client_connected_cb=None):
+        self._client_connected_cb = client_connected_cb
+        self._connection_task     = None
+
+        self.transport = None
+
+        self._recv     = ReceiveBuffer(self._initial_buffer_size)
+        self._received = False
+
+        self._read_waiter    = None
+        self._reading_paused = False
+        self._eof            = False
+        self._exception      = None
+
+        self._writing_paused = False
+        self._drain_waiters  = collections.deque()
+
+        # Set while frames are received with 'receive_frames'.
+        self._frame_handler = None
+        self._frame_waiter  = None
+        self._frames_ended  = None
+
+        self._closed = None
+
+    def connection_made(self, transport):
+        loop = asyncio.get_running_loop()
+
+        self.transport = transport
+        self._closed   = loop.create_future()
+
+        if self._client_connected_cb is not None:
+            self._connection_task = loop.create_task(self._client_connected_cb(self, ProtocolWriter(self)))
+            self._connection_task.add_done_callback(self._on_connection_done)
+
+    def _on_connection_done(self, task):
+        if task.cancelled():
+            return
+
+        exc = task.exception()
+        if exc is None:
+            return
+
+        task.get_loop().call_exception_handler(dict(
+            message   = "Unhandled exception in client_connected_cb",
+            exception = exc,
+            transport = self.transport,
+        ))
+
+        self.transport.close()
+
+    def _wake_reader(self):
+        if self._read_waiter is not None and not self._read_waiter.done():
+            self._read_waiter.set_result(None)
+
+    def connection_lost(self, exc):
+        self._exception = exc
+        self._eof       = True
+
+        self._wake_reader()
+
+        if self._frame_waiter is None:
+            self._end_frames(exc)
+
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+        self._drain_waiters.clear()
+
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
+
+    def eof_received(self):
+        self._eof = True
+
+        self._wake_reader()
+
+        if self._frame_waiter is None:
+            self._end_frames(None)
+
+        # Keep the transport open so we may still write, like 'asyncio.StreamReaderProtocol'.
+        return True
+
+    def get_buffer(self, sizehint):
+        return self._recv.view[self._recv.end:]
+
+    def buffer_updated(self, nbytes):
+        self._recv.end += nbytes
+        self._received  = True
+
+        if self._frame_handler is not None and self._frame_waiter is None:
+            self._handle_frames()
+
+        # Wait for frames to be handled or to be asked for more data before compacting.
+        if self._recv.is_full():
+            self.transport.pause_reading()
+            self._reading_paused = True
+
+        self._wake_reader()
+
+    def _resume_reading(self):
+        if self._reading_paused and not self._recv.is_full():
+            self._reading_paused = False
+            self.transport.resume_reading()
+
+    async def _wait_for_data(self):
+        # Returns whether data was received since last
+        # called, waiting for it if needed.
+
+        while not self._received:
+            if self._exception is not None:
+                raise self._exception
+
+            if self._eof:
+                return False
+
+            self._read_waiter = asyncio.get_running_loop().create_future()
+
+            try:
+                await self._read_waiter
+
+            finally:
+                self._read_waiter = None
+
+        self._received = False
+
+        return True
+
+    def at_eof(self):
+        return self._eof and len(self._recv) == 0
+
+    def _use_buffer(self, recv):
+        # Receives into 'recv' from now on, returning how much of
+        # what was received into the previous buffer was handed over.
+
+        recv.compact()
+
+        if recv is self._recv:
+            return 0
+
+        pending     = self._recv.view[self._recv.start:self._recv.end]
+        handed_over = len(pending)
+
+        recv.view[recv.end:recv.end + handed_over] = pending
+        recv.end += handed_over
+
+        self._recv = recv
+
+        return handed_over
+
+    async def receive_into(self, recv):
+        # Receives more data into 'recv' from now on, returning whether
+        # any was received. Views of the data before 'recv.start' are
+        # no longer valid afterwards.
+
+        handed_over = self._use_buffer(recv)
+
+        self._resume_reading()
+
+        if handed_over > 0:
+            return True
+
+        return await self._wait_for_data()
+
+    async def receive_frames(self, recv, handler):
+        # Receives into 'recv' from now on, calling 'handler' with the client
+        # ID, packet ID and view of each frame as soon as it's received, until
+        # EOF is reached. Exceptions from 'handler' are raised from here.
+        #
+        # If 'handler' returns an awaitable, no more frames are handled until
+        # it's done. The view is valid until then, or until 'handler' returns.
+
+        self._use_buffer(recv)
+
+        self._frame_handler = handler
+        self._frames_ended  = asyncio.get_running_loop().create_future()
+
+        try:
+            self._handle_frames()
+
+            await self._frames_ended
+
+        finally:
+            if self._frame_waiter is not None:
+                self._frame_waiter.cancel()
+
+            self._frame_handler = None
+            self._frame_waiter  = None
+            self._frames_ended  = None
+
+    def _handle_frames(self):
+        recv = self._recv
+
+        # Frames received before closing aren't handled, like they wouldn't be read.
+        while not self.transport.is_closing():
+            try:
+                frame = recv.next_frame()
+                if frame is None:
+                    break
+
+                result = self._frame_handler(*frame)
+
+            except Exception as e:
+                self._end_frames(e)
+
+                return
+
+            if result is not None:
+                self._frame_waiter = asyncio.ensure_future(result)
+                self._frame_waiter.add_done_callback(self._on_frame_handled)
+
+                return
+
+        # Every frame has been handled, so their views are no longer needed.
+        recv.compact()
+
+        if self._eof:
+            self._end_frames(self._exception)
+
+            return
+
+        self._resume_reading()
+
+    def _on_frame_handled(self, waiter):
+        if waiter is not self._frame_waiter:
+            return
+
+        self._frame_waiter = None
+
+        if waiter.cancelled():
+            self._end_frames(asyncio.CancelledError())
+
+            return
+
+        exc = waiter.exception()
+        if exc is not None:
+            self._end_frames(exc)
+
+            return
+
+        self._handle_frames()
+
+    def _end_frames(self, exc):
+        ended = self._frames_ended
+        if ended is None or ended.done():
+            return
+
+        if exc is None:
+            ended.set_result(None)
+        else:
+            ended.set_exception(exc)
+
+    async def readinto(self, view):
+        while len(self._recv) == 0:
+            if not await self._wait_for_data():
+                return 0
+
+        recv = self._recv
+        size = min(len(view), len(recv))
+
+        view[:size] = recv.view[recv.start:recv.start + size]
+        recv.start += size
+
+        # The data has been copied out, so it's safe to compact.
+        recv.compact()
+        self._resume_reading()
+
+        return size
+
+    async def readexactly(self, n):
+        data = bytearray(n)
+        view = memoryview(data)
+
+        received = 0
+        while received < n:
+            size = await self.readinto(view[received:])
+            if size == 0:
+                raise asyncio.IncompleteReadError(bytes(data[:received]), n)
+
+            received += size
+
+        return bytes(data)
+
+    def pause_writing(self):
+        self._writing_paused = True
+
+    def resume_writing(self):
+        self._writing_paused = False
+
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+        self._drain_waiters.clear()
+
+    async def _drain_helper(self):
+        if self._closed.done():
+            raise ConnectionResetError("Connection lost")
+
+        if not self._writing_paused:
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._drain_waiters.append(waiter)
+
+        await waiter
+
+class ProtocolWriter:
+    # Provides the parts of the 'asyncio.StreamWriter' API used by connections.
+
+    def __init__(self, protocol):
+        self.protocol  = protocol
+        self.transport = protocol.transport
+
+    def write(self, data):
+        self.transport.write(data)
+
+    async def drain(self):
+        if self.transport.is_closing():
+            # Let the connection be lost before we check for it.
+            await asyncio.sleep(0)
+
+        await self.protocol._drain_helper()
+
+    def close(self):
+        self.transport.close()
+
+    def is_closing(self):
+        return self.transport.is_closing()
+
+    async def wait_closed(self):
+        await asyncio.shield(self.protocol._closed)
+
+    def get_extra_info(self, name, default=None):
+        return self.transport.get_extra_info(name, default)
+
+async def open_connection(host=None, port=None, **kwargs):
+    loop = asyncio.get_running_loop()
+
+    transport, protocol = await loop.create_connection(PacketProtocol, host, port, **kwargs)
+
+    return protocol, ProtocolWriter(protocol)
+
+async def start_server(client_connected_cb, host=None, port=None, **kwargs):
+    loop = asyncio.get_running_loop()
+
+    return await loop.create_server(lambda: PacketProtocol(client_connected_cb), host, port, **kwargs)
+
+def run(coro, *, use_uvloop=False):
+    if use_uvloop and uvloop is not None:
+        return uvloop.run(coro)
+
+    return asyncio.run(coro)
@@ -12,16 +12,31 @@ class Uid(pak.Type):
     _size    = 0x10
     _default = uuid.UUID(int=0)
 
+    @classmethod
+    def _from_bytes(cls, data):
+        return uuid.UUID(bytes_le=data)
+
+    @classmethod
+    def _to_bytes(cls, value):
+        return value.bytes_le
+
     @classmethod
     def _unpack(cls, buf, *, ctx):
-        return uuid.UUID(bytes_le=buf.read(0x10))
+        return cls._from_bytes(buf.read(0x10))
 
     @classmethod
     def _pack(cls, value, *, ctx):
-        return value.bytes_le
+        return cls._to_bytes(value)
 
 class _Float32Array(pak.Type):
     _num_floats = None
+    _dtype      = np.dtype("<f4")
+
+    # When set, unpacked arrays are read-only little-endian float32
+    # views over the bytes read for the field, skipping the conversion
+    # to freshly allocated float64 arrays. They don't view the packet
+    # data itself since receive buffers are reused between reads.
+    zero_copy = False
 
     @classmethod
     def __init_subclass__(cls, **kwargs):
@@ -30,13 +45,26 @@ class _Float32Array(pak.Type):
         cls._size    = 4 * cls._num_floats
         cls._default = np.array([0.0] * cls._num_floats)
 
+    @classmethod
+    def _from_bytes(cls, data):
+        value = np.frombuffer(data, dtype=cls._dtype, count=cls._num_floats)
+
+        if cls.zero_copy:
+            return value
+
+        return value.astype(np.float64)
+
+    @classmethod
+    def _to_bytes(cls, value):
+        return np.asarray(value[:cls._num_floats], dtype=cls._dtype).tobytes()
+
     @classmethod
     def _unpack(cls, buf, *, ctx):
-        return np.array([pak.Float32.unpack(buf, ctx=ctx) for x in range(cls._num_floats)])
+        return cls._from_bytes(buf.read(cls._size))
 
     @classmethod
     def _pack(cls, value, *, ctx):
-        return b"".join(pak.Float32.pack(value[x], ctx=ctx) for x in range(cls._num_floats))
+        return cls._to_bytes(value)
 
 class Vector3f(_Float32Array):
     _num_floats = 3
@@ -0,0 +1,282 @@
+import asyncio
+import bisect
+import collections
+import hashlib
+import socket
+
+from . import codec
+from . import transport
+
+__all__ = [
+    "Upstream",
+    "LeastConnections",
+    "ConsistentHash",
+    "Weighted",
+]
+
+class Upstream:
+    # A server which a 'Proxy' may connect players to.
+    #
+    # Health is tracked passively: failing to connect, or the server
+    # closing a player's connection soon after it was opened, marks
+    # the upstream as down for a while, doubling each time in a row.
+
+    backoff     = 1.0
+    max_backoff = 30.0
+
+    # How many seconds a pooled connection has to send its 'InitPacket'.
+    init_timeout = 5.0
+
+    def __init__(self, address, port=1027, *, weight=1, max_connections=None):
+        self.address = address
+        self.port    = port
+
+        self.weight = weight
+
+        # If not 'None', the upstream is considered busy at this many players.
+        self.max_connections = max_connections
+
+        # How many players are connected through us.
+        self.connections = 0
+
+        # The max players the upstream sent in its 'InitPacket', once known.
+        self.max_players = None
+
+        # How many times in a row we've failed.
+        self.failures   = 0
+        self.down_until = 0.0
+
+        # Set by the 'Proxy', see 'Proxy.upstream_pool_size'.
+        self.use_protocol  = False
+        self.pool_size     = 0
+        self.pool_interval = 5
+
+        self.pool_hits   = 0
+        self.pool_misses = 0
+
+        self._pool        = collections.deque()
+        self._pool_refill = asyncio.Event()
+        self._pool_task   = None
+
+        # The resolved address, see 'resolve_address'.
+        self._sockaddr = None
+
+    def __repr__(self):
+        return f"{type(self).__qualname__}({self.address!r}, {self.port!r}, weight={self.weight!r})"
+
+    def is_available(self):
+        if self.max_connections is not None and self.connections >= self.max_connections:
+            return False
+
+        return asyncio.get_running_loop().time() >= self.down_until
+
+    def record_success(self):
+        self.failures   = 0
+        self.down_until = 0.0
+
+    def record_failure(self):
+        self.failures += 1
+
+        backoff = min(self.backoff * 2 ** (self.failures - 1), self.max_backoff)
+
+        self.down_until = asyncio.get_running_loop().time() + backoff
+
+    async def resolve_address(self):
+        # The address is only resolved once, until connecting to it fails.
+
+        if self._sockaddr is None:
+            addrinfo = await asyncio.get_running_loop().getaddrinfo(self.address, self.port, type=socket.SOCK_STREAM)
+
+            self._sockaddr = addrinfo[0][4]
+
+        return self._sockaddr
+
+    async def open_streams(self):
+        try:
+            host, port = (await self.resolve_address())[:2]
+
+            if self.use_protocol:
+                return await transport.open_connection(host, port)
+
+            return await asyncio.open_connection(host, port)
+
+        except OSError:
+            self._sockaddr = None
+
+            self.record_failure()
+
+            raise
+
+    @staticmethod
+    async def _read_frame(reader):
+        header = await reader.readexactly(codec.HEADER_SIZE)
+
+        _, _, size = codec.unpack_header(header)
+
+        return header + await reader.readexactly(size)
+
+    async def _open_pooled_streams(self):
+        # Reads the upstream's 'InitPacket' ahead so that nothing is left
+        # unread, which lets closing an idle connection show up as EOF.
+        #
+        # Returns the streams and the frame of the 'InitPacket'.
+
+        reader, writer = await self.open_streams()
+
+        try:
+            init_frame = await asyncio.wait_for(self._read_frame(reader), self.init_timeout)
+
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            writer.close()
+
+            self.record_failure()
+
+            raise OSError("upstream didn't send its InitPacket") from e
+
+        return reader, writer, init_frame
+
+    @staticmethod
+    def _streams_are_healthy(reader, writer):
+        return not writer.is_closing() and not reader.at_eof()
+
+    @property
+    def pool_depth(self):
+        return len(self._pool)
+
+    async def take_streams(self):
+        # Prefers an already open connection from the pool.
+        #
+        # Returns the streams and the frame of the 'InitPacket' the upstream
+        # sent on them if it has already been read, or else 'None'.
+
+        while len(self._pool) > 0:
+            reader, writer, init_frame = self._pool.popleft()
+            self._pool_refill.set()
+
+            if self._streams_are_healthy(reader, writer):
+                self.pool_hits += 1
+
+                return reader, writer, init_frame
+
+            writer.close()
+
+        if self.pool_size > 0:
+            self.pool_misses += 1
+
+        return *await self.open_streams(), None
+
+    async def _maintain_pool(self):
+        while True:
+            healthy_streams = collections.deque()
+            for reader, writer, init_frame in self._pool:
+                if self._streams_are_healthy(reader, writer):
+                    healthy_streams.append((reader, writer, init_frame))
+                else:
+                    writer.close()
+
+            self._pool = healthy_streams
+
+            while len(self._pool) < self.pool_size:
+                try:
+                    self._pool.append(await self._open_pooled_streams())
+
+                # Try again at the next check.
+                except OSError:
+                    break
+
+            self._pool_refill.clear()
+
+            try:
+                await asyncio.wait_for(self._pool_refill.wait(), self.pool_interval)
+
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self.pool_size > 0 and self._pool_task is None:
+            self._pool_task = asyncio.create_task(self._maintain_pool())
+
+    def close(self):
+        if self._pool_task is not None:
+            self._pool_task.cancel()
+            self._pool_task = None
+
+        for reader, writer, init_frame in self._pool:
+            writer.close()
+
+        self._pool.clear()
+
+# Placement policies choose which of the available upstreams a player
+# connects to. If a policy needs the player's client ID, the 'Proxy'
+# waits for the player's first packet before connecting to an upstream.
+
+class LeastConnections:
+    needs_client_id = False
+
+    def choose(self, upstreams, *, client_id=None):
+        return min(upstreams, key=lambda upstream: upstream.connections / upstream.weight)
+
+class ConsistentHash:
+    # Players keep connecting to the same upstream as long as it's available,
+    # and only the players of an unavailable upstream are moved elsewhere.
+
+    needs_client_id = True
+
+    def __init__(self, *, replicas=100):
+        self.replicas = replicas
+
+        # Maps tuples of upstreams to their hash ring.
+        self._rings = {}
+
+    @staticmethod
+    def _hash(data):
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+    def _ring(self, upstreams):
+        ring = self._rings.get(upstreams)
+
+        if ring is None:
+            points = sorted(
+                (self._hash(f"{upstream.address}:{upstream.port}#{replica}".encode()), index)
+
+                for index, upstream in enumerate(upstreams)
+                for replica in range(self.replicas * upstream.weight)
+            )
+
+            ring = ([point for point, index in points], [upstreams[index] for point, index in points])
+
+            self._rings[upstreams] = ring
+
+        return ring
+
+    def choose(self, upstreams, *, client_id):
+        points, ring_upstreams = self._ring(tuple(upstreams))
+
+        position = bisect.bisect(points, self._hash(client_id.bytes))
+
+        return ring_upstreams[position % len(ring_upstreams)]
+
+class Weighted:
+    # Smooth weighted round-robin, which interleaves upstreams in proportion to their weights.
+
+    needs_client_id = False
+
+    def __init__(self):
+        self._current = {}
+
+    def choose(self, upstreams, *, client_id=None):
+        total  = 0
+        chosen = None
+
+        for upstream in upstreams:
+            current = self._current.get(upstream, 0) + upstream.weight
+            self._current[upstream] = current
+
+            total += upstream.weight
+
+            if chosen is None or current > self._current[chosen]:
+                chosen = upstream
+
+        self._current[chosen] -= total
+
+        return chosen
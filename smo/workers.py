@@ -0,0 +1,57 @@
+import multiprocessing
+import os
+import tempfile
+
+from .server import Server
+
+__all__ = [
+    "run_workers",
+]
+
+def _run_worker(server_cls, kwargs):
+    server_cls(**kwargs).run()
+
+def run_workers(workers=None, *, server_cls=Server, socket_dir=None, **kwargs):
+    # Serves one lobby from 'workers' processes, defaulting to one per CPU.
+    #
+    # Each worker runs 'server_cls(**kwargs)' listening on the same port
+    # with 'SO_REUSEPORT', so the kernel spreads connections between them.
+    # Workers are linked to each other over Unix sockets in 'socket_dir',
+    # see 'Server.PeerLink', so that every player sees every other player.
+
+    if workers is None:
+        workers = os.cpu_count()
+
+    with tempfile.TemporaryDirectory(prefix="smo-") as tmp_dir:
+        if socket_dir is None:
+            socket_dir = tmp_dir
+
+        peer_paths = [os.path.join(socket_dir, f"worker-{index}.sock") for index in range(workers)]
+
+        processes = []
+        for index, peer_path in enumerate(peer_paths):
+            # Each worker connects to the ones started before it.
+            worker_kwargs = dict(
+                kwargs,
+
+                reuse_port = True,
+                peer_path  = peer_path,
+                peer_paths = peer_paths[:index],
+            )
+
+            process = multiprocessing.Process(target=_run_worker, args=(server_cls, worker_kwargs), daemon=True)
+            process.start()
+
+            processes.append(process)
+
+        try:
+            for process in processes:
+                process.join()
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            for process in processes:
+                process.terminate()
+                process.join()